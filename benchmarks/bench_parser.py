@@ -0,0 +1,187 @@
+"""simplelist.php の解析速度・メモリ比較 (pd.read_html と simplelist_parser)
+
+使い方:
+    python benchmarks/bench_parser.py                 # history.csv から作った疑似ページで計測
+    python benchmarks/bench_parser.py --pages DIR     # 保存済みのページ (DIR/*.html) で計測
+    python benchmarks/bench_parser.py --rows 2000     # 1ページの行数を増やして計測
+
+各方式は別プロセスで実行し、所要時間と最大メモリ使用量の増分を比較する。
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+PAGE_COLUMNS = ['順番', '曲名（ファイル名）', '作品名', '歌手名', '歌った人', 'コメント']
+
+
+# --- 関数: history.csv から部屋ごとの疑似 simplelist.php を作成 ---
+# 各ページは rows_per_page 行 (部屋の履歴が足りなければ繰り返して埋める)
+def build_pages_from_history(rows_per_page=100, header_every=50):
+    rows_by_owner = defaultdict(list)
+    with open(os.path.join(ROOT_DIR, "history.csv"), encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            rows_by_owner[row['部屋主']].append(row)
+
+    header_html = "".join(f"<th>{c}</th>" for c in PAGE_COLUMNS)
+    header_td = "".join(f"<td>{c}</td>" for c in PAGE_COLUMNS)
+    pages = []
+    for owner, rows in rows_by_owner.items():
+        lines = ['<html><head><meta charset="UTF-8"></head><body><table border="1">',
+                 f"<tr>{header_html}</tr>"]
+        for i in range(rows_per_page):
+            if i and i % header_every == 0:
+                lines.append(f"<tr>{header_td}</tr>")
+            row = rows[i % len(rows)]
+            lines.append("<tr>" + "".join(f"<td>{row[c]}</td>" for c in PAGE_COLUMNS) + "</tr>")
+        lines.append("</table></body></html>")
+        pages.append("\n".join(lines).encode("utf-8"))
+    return pages
+
+
+def load_pages(pages_dir, rows_per_page):
+    if pages_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+            with open(path, "rb") as f:
+                pages.append(f.read())
+        return pages
+    return build_pages_from_history(rows_per_page)
+
+
+# --- 関数: 旧方式 (pd.read_html + 見出し行の除去) ---
+def parse_read_html(content):
+    import pandas as pd
+    from io import BytesIO
+    df = pd.read_html(BytesIO(content))[0].fillna("")
+    for col in ['曲名（ファイル名）', '作品名', '歌手名']:
+        if col in df.columns:
+            df = df[df[col] != col]
+    return df
+
+
+# --- 関数: 新方式 (simplelist_parser) ---
+def parse_streaming(content):
+    from room_fetcher import parse_page
+    df, _ = parse_page(content, "", "")
+    return df.drop(columns=['部屋主', '取得日', 'temp_ingest'])
+
+
+METHODS = {"read_html": parse_read_html, "streaming": parse_streaming}
+
+
+# --- 関数: 子プロセス側の計測 ---
+# --- 関数: 最大RSSの計測 (Linux は計測区間ごとに最大値をリセットする) ---
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def read_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+
+
+def run_method(method, pages_dir, rows_per_page, repeat):
+    import pandas  # noqa: F401  (読み込みコストは比較対象から除く)
+    import lxml.html  # noqa: F401
+    import room_fetcher  # noqa: F401
+
+    pages = load_pages(pages_dir, rows_per_page)
+    func = METHODS[method]
+    func(pages[0])  # 初回の遅延読み込みを除外
+
+    # 所要時間 (tracemalloc なし) と最大RSSの増分
+    reset_peak_rss()
+    rss_before, _ = read_rss_kb()
+    started = time.perf_counter()
+    rows = 0
+    for _ in range(repeat):
+        for content in pages:
+            rows += len(func(content))
+    elapsed = time.perf_counter() - started
+    _, rss_peak = read_rss_kb()
+
+    # Python ヒープの最大使用量 (lxml 内部の確保分は含まれない)
+    tracemalloc.start()
+    for content in pages:
+        func(content)
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "method": method,
+        "pages": len(pages) * repeat,
+        "rows": rows,
+        "seconds": elapsed,
+        "py_peak_kb": py_peak // 1024,
+        "rss_growth_kb": rss_peak - rss_before,
+    }))
+
+
+# --- 関数: 両方式の結果が一致するか確認 ---
+def check_equivalence(pages):
+    mismatched = 0
+    for content in pages:
+        a = parse_read_html(content).astype(str).reset_index(drop=True)
+        b = parse_streaming(content).astype(str).reset_index(drop=True)
+        if list(a.columns) != list(b.columns) or not a.equals(b):
+            mismatched += 1
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", help="保存済みページ (*.html) のディレクトリ")
+    parser.add_argument("--rows", type=int, default=100, help="疑似ページ1枚あたりの行数")
+    parser.add_argument("--repeat", type=int, default=5, help="ページ一式を解析する回数")
+    parser.add_argument("--method", choices=list(METHODS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        run_method(args.method, args.pages, args.rows, args.repeat)
+        return
+
+    pages = load_pages(args.pages, args.rows)
+    print(f"ページ数: {len(pages)} (合計 {sum(len(p) for p in pages) / 1024:.0f} KB), 繰り返し: {args.repeat}")
+
+    results = []
+    for method in METHODS:
+        cmd = [sys.executable, os.path.abspath(__file__), "--method", method, "--rows", str(args.rows),
+               "--repeat", str(args.repeat)]
+        if args.pages:
+            cmd += ["--pages", args.pages]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'方式':<10} {'行数':>8} {'秒':>8} {'ページ/秒':>10} {'Pythonヒープ最大(KB)':>20} {'最大RSS増分(KB)':>12}")
+    for r in results:
+        print(f"{r['method']:<10} {r['rows']:>8} {r['seconds']:>8.3f} {r['pages'] / r['seconds']:>10.1f} "
+              f"{r['py_peak_kb']:>20} {r['rss_growth_kb']:>12}")
+    base, new = results
+    print(f"速度比: {base['seconds'] / new['seconds']:.2f} 倍")
+
+    mismatched = check_equivalence(pages)
+    print("解析結果: 一致" if mismatched == 0 else f"解析結果: {mismatched} ページで不一致")
+
+
+if __name__ == "__main__":
+    main()
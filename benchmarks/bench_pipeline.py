@@ -0,0 +1,297 @@
+"""履歴の件数を増やしたときの処理段階ごとの所要時間の計測
+
+使い方:
+    python benchmarks/bench_pipeline.py                        # 1万・10万・100万行で計測して表示
+    python benchmarks/bench_pipeline.py --sizes 10k,100k       # 件数を指定
+    python benchmarks/bench_pipeline.py --save-baseline        # 結果を基準値ファイルに保存
+    python benchmarks/bench_pipeline.py --compare              # 基準値と比べ、遅くなった段階があれば終了コード 1
+    python benchmarks/bench_pipeline.py --write-history out.csv --sizes 100k   # 疑似履歴を CSV に書き出すだけ
+
+疑似履歴は乱数の種を固定して作るので、同じ件数なら毎回同じデータになる。
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import text_normalizer  # noqa: E402
+import update_list  # noqa: E402
+from build_manifest import source_digest  # noqa: E402
+from cool_items import parse_cool_rows  # noqa: E402
+from daily_rollup import load_rollup  # noqa: E402
+from history_store import HISTORY_COLUMNS, load_history, open_history_db, sync_history_db  # noqa: E402
+from room_fetcher import parse_page  # noqa: E402
+
+DEFAULT_SIZES = "10k,100k,1m"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+# これより短い段階は誤差が大きいので比較しない
+MIN_COMPARE_SECONDS = 0.05
+SEED = 20260101
+END_DATE = datetime.date(2026, 3, 31)
+
+PAGE_COLUMNS = ['順番', '曲名（ファイル名）', '作品名', '歌手名', '歌った人', 'コメント']
+# 段階は update_list の実行と同じ関数を呼ぶ (setlist: 取得月ごとのJSON、render: index.html の書き出し)
+STAGES = ["parse", "merge", "normalize", "rollup", "load_offline", "match", "ranking", "setlist", "render"]
+
+# --- 疑似データの材料 ---
+_WORDS = [
+    "青い", "春", "夜空", "君", "世界", "約束", "星", "光", "夢", "未来", "風", "花火", "言葉", "奇跡",
+    "ひかり", "さくら", "ありがとう", "ミライ", "ハート", "ドリーム", "シンフォニー", "メロディ", "スター",
+    "Love", "Story", "Brave", "Shine", "Days", "Blue", "Dream", "Road", "Fire", "Sky", "Heart",
+]
+_WORK_WORDS = ["魔法", "少女", "学園", "戦記", "物語", "の", "異世界", "探偵", "アイドル", "Project", "ラブ", "ライブ", "!!"]
+_SUFFIXES = ["", "", "", "", " +2", " -1", " KEY+3", " 原キー", " キー変更:-2", " (Short Ver.)", " [TV Size]", "~ off vocal"]
+_EXTENSIONS = ["", ".mp4", ".mp3", ".m4a", ".wav"]
+_FAMILY = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤", "Sato", "Yuki", "みつ", "ぽん"]
+_GIVEN = ["太郎", "花子", "さん", "ちゃん", "P", "丸", "子", "乃", "助", "", "7", "_2"]
+
+
+def _phrase(rng, words, low, high):
+    return "".join(rng.choice(words) for _ in range(rng.randint(low, high)))
+
+
+# --- 関数: 疑似データ (作品・曲・歌い手・部屋) の語彙を作る ---
+def build_vocabulary(rng, n_works=600, n_singers=2000, n_rooms=60):
+    works = list(dict.fromkeys(_phrase(rng, _WORK_WORDS, 2, 4) + str(rng.randint(1, 9)) for _ in range(n_works)))
+    songs = [(rng.choice(works), _phrase(rng, _WORDS, 1, 3)) for _ in range(n_works * 4)]
+    singers = list(dict.fromkeys(rng.choice(_FAMILY) + rng.choice(_GIVEN) + str(i % 97) for i in range(n_singers)))
+    singers += ["test", "システム"]
+    rooms = [f"疑似部屋{i:02d}" for i in range(n_rooms)]
+    return {"works": works, "songs": songs, "singers": singers, "rooms": rooms}
+
+
+# --- 関数: 疑似履歴 (history.csv と同じ列) を作る ---
+def generate_history(n_rows, seed=SEED):
+    rng = random.Random(seed)
+    vocab = build_vocabulary(rng)
+    days = max(30, n_rows // 400)
+    # 集計期間 (update_list.TARGET_START_DATE〜TARGET_END_DATE) で終わるようにする
+    start = END_DATE - datetime.timedelta(days=days - 1)
+    counters = {room: 0 for room in vocab["rooms"]}
+    rows = []
+    for i in range(n_rows):
+        room = rng.choice(vocab["rooms"])
+        counters[room] += 1
+        work, title = rng.choice(vocab["songs"])
+        filename = title + rng.choice(_SUFFIXES)
+        if rng.random() < 0.3:
+            filename = f"【{work}】" + filename
+        filename += rng.choice(_EXTENSIONS)
+        work_name = work if rng.random() < 0.8 else rng.choice(["-", "", "−"])
+        day = start + datetime.timedelta(days=i * days // n_rows)
+        rows.append({
+            '部屋主': room,
+            '順番': counters[room],
+            '曲名（ファイル名）': filename,
+            '作品名': work_name,
+            '歌手名': rng.choice(vocab["singers"]) if rng.random() < 0.3 else "",
+            '歌った人': rng.choice(vocab["singers"]),
+            'コメント': "",
+            '取得日': day.strftime("%Y/%m/%d"),
+        })
+    df = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+    return df.iloc[::-1].reset_index(drop=True), vocab, rng
+
+
+# --- 関数: 疑似のクール集計表 (cool_analysis.csv と同じ並びの行) を作る ---
+def generate_cool_rows(vocab, rng, n_items=300):
+    rows = [[update_list.GRAPH_TARGET_CATEGORY], ["作品名", "種別", "歌手", "曲名"]]
+    for work, title in rng.sample(vocab["songs"], min(n_items, len(vocab["songs"]))):
+        rows.append([work, rng.choice(["OP", "ED"]), "", title])
+    return rows
+
+
+def generate_offline_lines(vocab, rng, n_lines=20000):
+    lines = []
+    for _ in range(n_lines):
+        work, title = rng.choice(vocab["songs"])
+        lines.append(f"{title}{rng.choice(_SUFFIXES)} ({work})")
+    return lines
+
+
+# --- 関数: 部屋ごとの simplelist.php の疑似ページを作る ---
+def build_pages(history_df):
+    pages = []
+    header_html = "".join(f"<th>{c}</th>" for c in PAGE_COLUMNS)
+    for owner, group in history_df.groupby('部屋主', sort=False):
+        lines = ['<html><head><meta charset="UTF-8"></head><body><table border="1">', f"<tr>{header_html}</tr>"]
+        for row in group[PAGE_COLUMNS].itertuples(index=False, name=None):
+            lines.append("<tr>" + "".join(f"<td>{v}</td>" for v in row) + "</tr>")
+        lines.append("</table></body></html>")
+        pages.append((owner, "\n".join(lines).encode("utf-8")))
+    return pages
+
+
+class _Timer:
+    def __init__(self):
+        self.results = {}
+
+    # 段階の関数が出す進捗表示は計測結果に混ぜない
+    def run(self, stage, func, *args, **kwargs):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = func(*args, **kwargs)
+        self.results[stage] = time.perf_counter() - started
+        return value
+
+
+# --- 関数: 1つの件数で全段階を計測 ---
+# 一時ディレクトリを作業ディレクトリにして、update_list の段階の関数をそのまま呼ぶ
+def run_size(n_rows):
+    history_df, vocab, rng = generate_history(n_rows)
+    cool_rows = generate_cool_rows(vocab, rng)
+    offline_lines = generate_offline_lines(vocab, rng)
+    pages = build_pages(history_df)
+    now = datetime.datetime.combine(END_DATE + datetime.timedelta(days=1), datetime.time(12),
+                                    datetime.timezone(datetime.timedelta(hours=9)))
+    generator_digest = source_digest(update_list.GENERATOR_SOURCES)
+    timer = _Timer()
+
+    # 取得ページの解析
+    def parse():
+        return [parse_page(content, owner, "2026/01/01")[0] for owner, content in pages]
+    timer.run("parse", parse)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            history_df.to_csv(update_list.history_file, index=False, encoding="utf-8-sig")
+            pd.DataFrame({'曲名': offline_lines}).to_csv("offline_list_bench.csv", index=False, encoding="utf-8")
+            conn = open_history_db()
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_history_db(conn, update_list.history_file)
+            new_df = history_df.head(max(1, n_rows // 100)).copy()
+            new_df['順番'] = new_df['順番'] + n_rows
+            new_df['temp_ingest'] = "append"
+
+            # 新しい行の追加・CSV書き出しと全履歴の読み込み
+            def merge():
+                update_list.merge_stage(conn, [new_df], update_list.history_file, {"ports": {}})
+                return load_history(conn)
+            final_df = timer.run("merge", merge)
+
+            # 曲名・作品名の正規化と除外 (集計用の行)
+            text_normalizer.clear_cache()
+            timer.run("normalize", update_list.normalize_stage, final_df)
+
+            # 日ごとの集計の作り直し (終わったクールのアーカイブ作成を含む)
+            categorized_data = parse_cool_rows(cool_rows, update_list.ALLOWED_CATEGORIES)
+            item_keys = update_list.cool_item_keys(categorized_data)
+
+            def rollup():
+                text_normalizer.clear_cache()
+                update_list.rollup_stage(conn, now, item_keys, generator_digest, force=True)
+                return load_rollup(conn)
+            rollup_df = timer.run("rollup", rollup)
+
+            # オフラインリストの読み込み (正規化・索引作成)
+            _, offline_index = timer.run("load_offline", update_list.load_offline_stage, ["offline_list_bench.csv"], {})
+
+            # 集計項目ごとの歌唱数・人数・作成数
+            cool_tables = timer.run("match", update_list.match_stage, rollup_df, categorized_data, offline_index)
+
+            # 推移グラフの順位計算とランキング表
+            graph_count, graph_user, rankings = timer.run(
+                "ranking", update_list.rank_stage, rollup_df, categorized_data, cool_tables)
+
+            # セットリストの取得月ごとのJSONと検索索引、index.html の書き出し
+            setlist_manifest = timer.run("setlist", update_list.setlist_stage, final_df, update_list.output_file)
+            timer.run("render", update_list.render_stage, setlist_manifest, cool_tables, rankings,
+                      graph_count, graph_user, now, update_list.output_file)
+            conn.close()
+        finally:
+            os.chdir(cwd)
+
+    return timer.results
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}
+    if text[-1:] in scale:
+        return int(float(text[:-1]) * scale[text[-1]])
+    return int(text)
+
+
+def print_results(results, baseline=None, threshold=DEFAULT_THRESHOLD):
+    slow = []
+    for size, stages in results.items():
+        print(f"\n{int(size):,} 行")
+        base_stages = (baseline or {}).get(size, {})
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            sec = stages[stage]
+            line = f"  {stage:<14} {sec:>9.3f} 秒"
+            base = base_stages.get(stage)
+            if base:
+                ratio = sec / base
+                line += f"  (基準 {base:.3f} 秒, {ratio:.2f} 倍)"
+                if ratio > 1 + threshold and sec - base > MIN_COMPARE_SECONDS:
+                    line += "  ← 遅くなっています"
+                    slow.append((size, stage))
+            print(line)
+    return slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="計測する行数 (カンマ区切り, 10k / 1m のように指定可)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基準値ファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="結果を基準値ファイルに保存する")
+    parser.add_argument("--compare", action="store_true", help="基準値と比較する")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="遅くなったとみなす割合 (0.2 = 20%%)")
+    parser.add_argument("--write-history", metavar="CSV", help="疑似履歴を書き出して終了する (件数は --sizes の最初の値)")
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    if args.write_history:
+        history_df, _, _ = generate_history(sizes[0])
+        history_df.to_csv(args.write_history, index=False, encoding="utf-8-sig")
+        print(f"{args.write_history} に {len(history_df):,} 行を書き出しました。")
+        return
+
+    results = {}
+    for n_rows in sizes:
+        print(f"{n_rows:,} 行を計測中...", flush=True)
+        results[str(n_rows)] = run_size(n_rows)
+
+    baseline = None
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"基準値ファイルがありません: {args.baseline} (--save-baseline で作成)")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    slow = print_results(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n基準値を保存しました: {args.baseline}")
+
+    if slow:
+        print(f"\n基準値より {args.threshold:.0%} 以上遅くなった段階: " + ", ".join(f"{s}行/{st}" for s, st in slow))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""text_normalizer と旧実装 (re.sub を順に適用) の出力一致確認・速度比較
+
+使い方:
+    python benchmarks/check_normalizer.py
+
+history.csv・offline_list_*.csv・cool_analysis.csv の実データと、
+境界ケースの文字列を照合用コーパスとして使う。1件でも不一致があれば終了コード 1。
+"""
+import csv
+import glob
+import os
+import re
+import sys
+import time
+import unicodedata
+
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import text_normalizer  # noqa: E402
+
+
+# --- 旧実装 (update_list.py にあったもの。照合の基準として変更しない) ---
+def legacy_normalize_text(text):
+    if not isinstance(text, str):
+        return str(text)
+
+    text = unicodedata.normalize('NFKC', text)
+    text = re.sub(r'\.[a-zA-Z0-9]{3,4}$', '', text)
+    text = re.sub(r'[\[\(\{【].*?[\]\)\}】]', ' ', text)
+    text = re.sub(r'(key|KEY)?\s*[\+\-]\s*[0-9]+', ' ', text)
+    text = re.sub(r'原キー', ' ', text)
+    text = re.sub(r'(キー)?変更[:：]?', ' ', text)
+    text = re.sub(r'[~〜～\-_=,.]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text.upper()
+
+
+def legacy_normalize_offline_text(text):
+    if not isinstance(text, str):
+        return str(text)
+
+    text = unicodedata.normalize('NFKC', text)
+    text = re.sub(r'\.[a-zA-Z0-9]{3,4}$', '', text)
+    text = re.sub(r'(key|KEY)?\s*[\+\-]\s*[0-9]+', ' ', text)
+    text = re.sub(r'原キー', ' ', text)
+    text = re.sub(r'(キー)?変更[:：]?', ' ', text)
+    text = re.sub(r'[~〜～\-_=,.]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text.upper()
+
+
+# 実データに出てこない組み合わせ (置換の順序に依存しそうなもの)
+EDGE_CASES = [
+    "", " ", "　", "abc", "ＡＢＣ", "song.mp4", "song.MP4.mp3", "a.b", "a.toolong",
+    "KEY(x)+2", "key +2", "KEY-1 原キー", "原キー変更", "キー原キー変更", "キー変更：-3", "変更:-3",
+    "キー+2", "(+2)", "【作品】曲名 key-1", "[a](b){c}【d】", "(a.mp4)", "(unclosed", "a)b(c",
+    "曲名  キー変更： -4", "x　y z w", "a\x1cb\x1fc", "tab\tnew\nline",
+    "～〜~-_=,.", "Ｋｅｙ＋２", "①②③", "ｶﾀｶﾅ", "KEY", "key", "-", "−", "1-2-3", "A+B",
+    "Re:ゼロ", "ｷｰ変更+1", "原ｷｰ", "【】", "()", "[]",
+]
+
+
+# --- 関数: 照合用コーパスの作成 ---
+def build_corpus():
+    values = list(EDGE_CASES)
+
+    history_file = os.path.join(ROOT_DIR, "history.csv")
+    if os.path.exists(history_file):
+        with open(history_file, encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                for col in ['曲名（ファイル名）', '作品名', '歌手名', '歌った人']:
+                    value = row.get(col) or ""
+                    values.append(value)
+                    values.extend(re.findall(r'【(.*?)】', value))
+
+    for path in sorted(glob.glob(os.path.join(ROOT_DIR, "offline_list_*.csv"))):
+        df = pd.read_csv(path).fillna("")
+        if '曲名' in df.columns:
+            values.extend(str(x) for x in df['曲名'].tolist())
+
+    cool_file = os.path.join(ROOT_DIR, "cool_analysis.csv")
+    if os.path.exists(cool_file):
+        with open(cool_file, encoding="utf-8-sig") as f:
+            for row in csv.reader(f):
+                values.extend(row)
+
+    return list(dict.fromkeys(values))
+
+
+def main():
+    corpus = build_corpus()
+    print(f"照合件数: {len(corpus)} (重複除外後)")
+
+    pairs = [
+        ("normalize_text", legacy_normalize_text, text_normalizer.normalize_text, False),
+        ("normalize_offline_text", legacy_normalize_offline_text, text_normalizer.normalize_offline_text, True),
+    ]
+    failed = False
+    for name, legacy, new, offline in pairs:
+        text_normalizer.clear_cache()
+        expected = [legacy(v) for v in corpus]
+        actual = [new(v) for v in corpus]
+        bulk = text_normalizer.normalize_many(corpus, offline=offline)
+        series = text_normalizer.normalize_series(pd.Series(corpus, dtype=object), offline=offline).tolist()
+
+        mismatches = [(v, e, a) for v, e, a in zip(corpus, expected, actual) if e.encode() != a.encode()]
+        mismatches += [(v, e, a) for v, e, a in zip(corpus, expected, bulk) if e != a]
+        mismatches += [(v, e, a) for v, e, a in zip(corpus, expected, series) if e != a]
+        if mismatches:
+            failed = True
+            print(f"{name}: 不一致 {len(mismatches)} 件")
+            for v, e, a in mismatches[:10]:
+                print(f"  入力 {v!r}\n    旧 {e!r}\n    新 {a!r}")
+        else:
+            print(f"{name}: 全件一致")
+
+        started = time.perf_counter()
+        for v in corpus:
+            legacy(v)
+        legacy_sec = time.perf_counter() - started
+
+        text_normalizer.clear_cache()
+        started = time.perf_counter()
+        for v in corpus:
+            new(v)
+        new_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for v in corpus:
+            new(v)
+        cached_sec = time.perf_counter() - started
+        print(f"  旧 {legacy_sec * 1000:.1f} ms / 新 {new_sec * 1000:.1f} ms "
+              f"({legacy_sec / new_sec:.1f} 倍) / 2回目以降 {cached_sec * 1000:.1f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
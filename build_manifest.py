@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+
+from room_fetcher import file_digest
+
+# --- 設定: 生成物の記録 (実行間で保持し、入力が変わっていない部分は作り直さない) ---
+# 各部分 (セットリスト・クール集計・ページ) ごとに、入力のハッシュ値から作ったキーと出力の情報を残す
+BUILD_MANIFEST_FILE = os.path.join(".cache", "build_manifest.json")
+# クール集計・ランキングの結果 (ページを作り直すだけの場合に使う)
+ANALYSIS_CACHE_FILE = os.path.join(".cache", "analysis_cache.json")
+
+
+# --- 関数: 値の組から1つのキーを作る (順序も含めて同じときだけ同じキー) ---
+def fingerprint(*parts):
+    text = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# --- 関数: 生成処理のソースのハッシュ値 (処理・テンプレートを変えたら作り直すため) ---
+def source_digest(paths):
+    return fingerprint(*[(os.path.basename(path), file_digest(path)) for path in paths])
+
+
+# --- 関数: 生成物の記録を読み込む (無い・壊れている場合は空) ---
+def load_build_manifest(manifest_file=BUILD_MANIFEST_FILE):
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"生成記録の読み込みエラー: {e}")
+        return {}
+
+
+# --- 関数: 生成物の記録を保存 (全出力を書き終えてから呼ぶ) ---
+def save_build_manifest(manifest, manifest_file=BUILD_MANIFEST_FILE):
+    _write_json(manifest, manifest_file)
+
+
+# --- 関数: 記録されたキーと同じで、出力ファイルもそのまま残っているか ---
+def is_fresh(manifest, section, key):
+    entry = manifest.get(section)
+    if entry is None or entry.get("key") != key:
+        return False
+    return all(file_digest(path) == digest for path, digest in entry.get("outputs", {}).items())
+
+
+# --- 関数: 出力ファイルのハッシュ値の一覧 (is_fresh で確かめる形) ---
+def output_digests(paths):
+    return {path: file_digest(path) for path in paths}
+
+
+# --- 関数: クール集計の結果を読み込む (キーが違う・無い場合は None) ---
+def load_analysis_cache(key, cache_file=ANALYSIS_CACHE_FILE):
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            cache = json.load(f)
+    except Exception as e:
+        print(f"集計キャッシュの読み込みエラー: {e}")
+        return None
+    if cache.get("key") != key:
+        return None
+    return cache
+
+
+# --- 関数: クール集計の結果を保存 ---
+def save_analysis_cache(key, cache_file=ANALYSIS_CACHE_FILE, **results):
+    _write_json(dict(results, key=key), cache_file)
+
+
+def _write_json(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_file, path)
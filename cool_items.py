@@ -0,0 +1,120 @@
+import codecs
+import csv
+import io
+import json
+import os
+
+from build_manifest import fingerprint
+from room_fetcher import file_digest
+from text_normalizer import normalize_text, normalize_offline_text
+
+# --- 設定: 集計表 (cool_analysis.csv) の読み込み ---
+# 文字コードは先頭のバイト列から判定する (BOM があれば utf-8-sig、utf-8 として読めなければ cp932)
+# 全体を読めなかった場合は、候補の残りを順に試す
+ENCODING_CANDIDATES = ['utf-8-sig', 'cp932', 'shift_jis']
+SNIFF_BYTES = 1 << 16
+# 読み込んだ項目 (正規化済みの曲名・作品名つき) の保存先。集計表と読み込み・正規化の処理が同じ間は読み直さない
+COOL_CACHE_FILE = os.path.join(".cache", "cool_items.json")
+_SOURCE = os.path.abspath(__file__)
+_NORMALIZER_SOURCE = os.path.join(os.path.dirname(_SOURCE), "text_normalizer.py")
+
+
+# --- 関数: 文字コードの判定 (候補を先頭から試し、先頭部分を読めたもの) ---
+def sniff_encoding(data, candidates=ENCODING_CANDIDATES):
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    prefix = data[:SNIFF_BYTES]
+    for enc in candidates:
+        try:
+            # 途中で切れた最後の文字は次のバイトを待つ扱いにする
+            codecs.getincrementaldecoder(enc)().decode(prefix, final=len(prefix) == len(data))
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+# --- 関数: バイト列を文字列にする (先頭部分で判定した文字コードから、候補を順に試す) ---
+# 戻り値: (文字列, 文字コード)。どれでも読めない場合は (None, None)
+def decode_text(data, candidates=ENCODING_CANDIDATES):
+    encoding = sniff_encoding(data, candidates)
+    if encoding is None:
+        return None, None
+    start = candidates.index(encoding) if encoding in candidates else 0
+    for enc in [encoding] + [c for c in candidates[start:] if c != encoding]:
+        try:
+            return data.decode(enc), enc
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
+# --- 関数: 集計表の行からカテゴリごとの項目を作る ---
+# 見出し行 (categories のどれかを含み「作品名」を含まない1列目) で区切り、その下の行を項目にする
+# 同じ内容の行は最後の行だけを使う (見出し行も同じ)
+# 戻り値: {カテゴリ名: [{"anime", "type", "artist", "song", "anime_norm", "song_norm", "song_raw_norm"}, ...]}
+def parse_cool_rows(rows, categories):
+    width = max((len(row) for row in rows), default=0)
+    rows = [tuple(row) + ("",) * (width - len(row)) for row in rows]
+    last_index = {row: i for i, row in enumerate(rows)}
+
+    categorized_data = {}
+    current_category = None
+    for i, row in enumerate(rows):
+        if last_index[row] != i:
+            continue
+        if not any(x.strip() for x in row): continue
+        col0 = row[0].strip()
+
+        if any(cat in col0 for cat in categories) and "作品名" not in col0:
+            current_category = col0
+            if current_category not in categorized_data:
+                categorized_data[current_category] = []
+            continue
+
+        if "作品名" in col0: continue
+        if current_category is None: continue
+
+        anime, type_, artist, song = (x.strip() for x in row[:4] + ("",) * (4 - len(row[:4])))
+        if not anime and not song: continue
+
+        categorized_data[current_category].append({
+            "anime": anime, "type": type_, "artist": artist, "song": song,
+            # 照合用 (曲名はカッコを消したものと残したもの)
+            "anime_norm": normalize_text(anime),
+            "song_norm": normalize_text(song),
+            "song_raw_norm": normalize_offline_text(song),
+        })
+    return categorized_data
+
+
+# --- 関数: 集計表を読み込む (前回と同じ内容なら保存した結果を使う) ---
+# 戻り値: parse_cool_rows の結果 (読めない場合は None)
+def load_cool_items(path, categories, cache_file=COOL_CACHE_FILE):
+    key = fingerprint("cool_items", file_digest(path), categories, file_digest(_SOURCE),
+                      file_digest(_NORMALIZER_SOURCE))
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("key") == key:
+                return cache["categories"]
+        except Exception as e:
+            print(f"集計表のキャッシュの読み込みエラー: {e}")
+
+    with open(path, "rb") as f:
+        data = f.read()
+    text, encoding = decode_text(data)
+    if text is None:
+        print("CSV読み込み失敗")
+        return None
+    print(f"集計表({path})をエンコーディング {encoding} で読み込みました。")
+
+    categorized_data = parse_cool_rows(list(csv.reader(io.StringIO(text, newline=""))), categories)
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "categories": categorized_data}, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+    return categorized_data
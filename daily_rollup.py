@@ -0,0 +1,97 @@
+import json
+
+import pandas as pd
+
+from history_store import max_history_seq
+from pattern_matcher import CoolItemMatcher
+
+# --- 設定: 日ごとの集計 (履歴DBに持つ) ---
+# (取得日, 集計項目の曲名・作品名 (正規化済み), 歌った人) ごとの歌唱数
+# 前回から取り込まれた行だけを照合して足し込み、集計表・ランキング・推移グラフはここから作る
+ROLLUP_COLUMNS = ['day', 'song', 'anime', '歌った人', 'count']
+
+
+# --- 関数: 日ごとの集計の表を用意する ---
+def open_rollup(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS rollup (
+            day TEXT NOT NULL,
+            song TEXT NOT NULL,
+            anime TEXT NOT NULL,
+            singer TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, song, anime, singer)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rollup_meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+
+
+def _get_state(conn):
+    row = conn.execute("SELECT value FROM rollup_meta WHERE key = 'state'").fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def _set_state(conn, state):
+    conn.execute("INSERT OR REPLACE INTO rollup_meta (key, value) VALUES ('state', ?)", (json.dumps(state),))
+
+
+# --- 関数: 集計用の行を集計項目と照合し、(日, 項目, 歌った人) ごとの歌唱数にまとめる ---
+# rows: dt_obj・norm_filename・norm_workname・歌った人・weight の列の DataFrame
+# item_keys: 集計項目の (曲名, 作品名) の一覧 (正規化済み、両方空の項目は除く)
+def rollup_rows(rows, item_keys):
+    if rows.empty or not item_keys:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    matcher = CoolItemMatcher(
+        rows['norm_filename'].tolist(),
+        rows['norm_workname'].tolist(),
+        [p for key in item_keys for p in key],
+    )
+    days = rows['dt_obj'].dt.strftime("%Y-%m-%d").to_numpy()
+    singers = rows['歌った人'].astype(str).to_numpy()
+    weights = rows['weight'].to_numpy()
+    parts = []
+    for song, anime in item_keys:
+        matched = matcher.match_rows(song, anime)
+        if len(matched):
+            parts.append(pd.DataFrame({
+                'day': days[matched], 'song': song, 'anime': anime,
+                '歌った人': singers[matched], 'count': weights[matched],
+            }))
+    if not parts:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    return pd.concat(parts, ignore_index=True).groupby(ROLLUP_COLUMNS[:4], sort=False, as_index=False)['count'].sum()
+
+
+# --- 関数: 日ごとの集計を最新の履歴に合わせる ---
+# key: 集計項目・正規化の処理・履歴DBの世代から作ったキー (前回と違えば作り直す)
+# load_all_rows(): 全期間の集計用の行 / load_new_rows(after_seq): 取り込み番号 after_seq より後の集計用の行
+# rebuild=True ならキーが同じでも作り直す
+# 戻り値: {"rebuilt": 作り直したか, "rows": 照合した行数, "added": 足し込んだ (日, 項目, 歌った人) の数}
+def update_rollup(conn, key, item_keys, load_all_rows, load_new_rows, rebuild=False):
+    open_rollup(conn)
+    state = _get_state(conn)
+    last_seq = max_history_seq(conn)
+    rebuilt = rebuild or state.get("key") != key
+    if not rebuilt and state.get("seq") == last_seq:
+        return {"rebuilt": False, "rows": 0, "added": 0}
+
+    rows = load_all_rows() if rebuilt else load_new_rows(state["seq"])
+    added = rollup_rows(rows, item_keys)
+    with conn:
+        if rebuilt:
+            conn.execute("DELETE FROM rollup")
+        conn.executemany(
+            "INSERT INTO rollup (day, song, anime, singer, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (day, song, anime, singer) DO UPDATE SET count = count + excluded.count",
+            [(day, song, anime, singer, int(count)) for day, song, anime, singer, count
+             in added.itertuples(index=False, name=None)],
+        )
+        _set_state(conn, {"key": key, "seq": last_seq})
+    return {"rebuilt": rebuilt, "rows": len(rows), "added": len(added)}
+
+
+# --- 関数: 日ごとの集計を読み込む (日付順) ---
+def load_rollup(conn):
+    open_rollup(conn)
+    return pd.read_sql_query(
+        'SELECT day, song, anime, singer AS "歌った人", count FROM rollup ORDER BY day, song, anime, singer', conn)
@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+from history_store import HISTORY_COLUMNS, intern_strings, load_history, typed_history_frame
+
+# --- 設定: 全履歴の列ごとの保存ファイル ---
+# load_history の結果を列ごとに「重複しない値の一覧 + 番号」で保存し、history.csv が同じ間は履歴DBから読み直さない
+HISTORY_FRAME_FILE = os.path.join(".cache", "history_frame.npz")
+# 保存形式 (変えたら作り直す)
+HISTORY_FRAME_FORMAT = 1
+
+
+# --- 関数: 文字列の一覧を UTF-8 の連結 + 各文字列のバイト数にする ---
+def pack_strings(texts):
+    encoded = [str(text).encode("utf-8") for text in texts]
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), np.array([len(b) for b in encoded], dtype=np.int64)
+
+
+# --- 関数: pack_strings の逆 ---
+def unpack_strings(blob, lengths):
+    data = blob.tobytes()
+    ends = np.cumsum(lengths).tolist()
+    return np.array([data[s:e].decode("utf-8") for s, e in zip([0] + ends[:-1], ends)], dtype=object)
+
+
+# --- 関数: 全履歴を保存する ---
+# key: 履歴の内容のキー (history.csv のハッシュ値)
+def save_history_frame(df, key, path=HISTORY_FRAME_FILE):
+    arrays = {}
+    for i, name in enumerate(HISTORY_COLUMNS):
+        uniques, codes = intern_strings(df[name].astype(object).to_numpy())
+        if name == '順番':
+            # 空の順番は None として値の一覧に印を付ける
+            missing = np.array([v == "" for v in uniques], dtype=bool)
+            arrays[f"c{i}_values"] = np.where(missing, 0, uniques).astype(np.int64)
+            arrays[f"c{i}_missing"] = missing
+        else:
+            arrays[f"c{i}_text"], arrays[f"c{i}_lengths"] = pack_strings(uniques)
+        arrays[f"c{i}_codes"] = codes
+    meta = {"format": HISTORY_FRAME_FORMAT, "key": key, "columns": HISTORY_COLUMNS, "rows": len(df)}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+                 **arrays)
+    os.replace(tmp_file, path)
+
+
+# --- 関数: 保存した全履歴を読み込む (無い・キーや形式が違う・読めない場合は None) ---
+def read_history_frame(key, path=HISTORY_FRAME_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if meta.get("format") != HISTORY_FRAME_FORMAT or meta.get("key") != key \
+                    or meta.get("columns") != HISTORY_COLUMNS:
+                return None
+            columns = {}
+            for i, name in enumerate(HISTORY_COLUMNS):
+                if f"c{i}_values" in data:
+                    uniques = data[f"c{i}_values"].astype(object)
+                    uniques[data[f"c{i}_missing"]] = None
+                else:
+                    uniques = unpack_strings(data[f"c{i}_text"], data[f"c{i}_lengths"])
+                columns[name] = (uniques, data[f"c{i}_codes"])
+    except Exception as e:
+        print(f"履歴の保存ファイルの読み込みエラー ({path}): {e}")
+        return None
+    return typed_history_frame(columns)
+
+
+# --- 関数: 全履歴を読み込む (保存ファイルが使えなければ履歴DBから読み込んで保存) ---
+# 戻り値: (履歴の DataFrame, 保存ファイルから読み込んだか)
+def load_history_frame(conn, key, path=HISTORY_FRAME_FILE):
+    df = read_history_frame(key, path)
+    if df is not None:
+        return df, True
+    df = load_history(conn)
+    save_history_frame(df, key, path)
+    return df, False
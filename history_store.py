@@ -0,0 +1,266 @@
+import csv
+import datetime
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from room_fetcher import file_digest
+
+# --- 設定: 履歴DB ---
+# history.csv (公開・コミット用) と同じ内容を索引付きで保持する作業用DB
+# history.csv と内容が食い違えば history.csv から作り直す
+HISTORY_DB_FILE = os.path.join(".cache", "history.sqlite3")
+HISTORY_COLUMNS = ['部屋主', '順番', '曲名（ファイル名）', '作品名', '歌手名', '歌った人', 'コメント', '取得日']
+KEY_COLUMNS = ['部屋主', '順番', '曲名（ファイル名）', '歌った人']
+# 読み込んだ履歴の列の型
+#   種類の少ない列はカテゴリ型 (値の一覧 + 番号)、それ以外の文字列の列も同じ値は1つの文字列を共有する
+#   順番は整数 (空の行があれば空文字を含む object 型)、取得日は文字列のまま残し、日付型の列を別に持つ
+CATEGORY_COLUMNS = ['部屋主', '歌った人', '取得日']
+HISTORY_DATE_COLUMN = 'dt_obj'
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+_COLS_SQL = ", ".join(_q(c) for c in HISTORY_COLUMNS)
+_KEY_SQL = ", ".join(_q(c) for c in KEY_COLUMNS)
+# history.csv と同じ並び (取得日・順番の降順、同順位は取り込み順)
+_ORDER_SQL = f"date_key IS NULL, date_key DESC, {_q('順番')} IS NULL, {_q('順番')} DESC, seq"
+
+
+# --- 関数: 取得日を並べ替え・範囲検索用の YYYY-MM-DD に変換 ---
+def to_date_key(value):
+    text = str(value).strip()
+    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _to_int(value):
+    if isinstance(value, int):
+        return value
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- 関数: 履歴DBを開く (無ければ作成) ---
+def open_history_db(db_file=HISTORY_DB_FILE):
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    # seq: 取り込み順 / epoch: 部屋の順番が振り直された回数 (同じ内容の行を別の行として持つ)
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS history (
+            seq INTEGER PRIMARY KEY,
+            {_q('部屋主')} TEXT NOT NULL,
+            {_q('順番')} INTEGER,
+            {_q('曲名（ファイル名）')} TEXT NOT NULL DEFAULT '',
+            {_q('作品名')} TEXT NOT NULL DEFAULT '',
+            {_q('歌手名')} TEXT NOT NULL DEFAULT '',
+            {_q('歌った人')} TEXT NOT NULL DEFAULT '',
+            {_q('コメント')} TEXT NOT NULL DEFAULT '',
+            {_q('取得日')} TEXT NOT NULL DEFAULT '',
+            date_key TEXT,
+            epoch INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_history_key ON history ({_KEY_SQL}, epoch);
+        CREATE INDEX IF NOT EXISTS ix_history_date_room ON history (date_key, {_q('部屋主')});
+        CREATE INDEX IF NOT EXISTS ix_history_room_date ON history ({_q('部屋主')}, date_key);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    return conn
+
+
+def _get_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _row_values(row):
+    values = [row.get(c, "") for c in HISTORY_COLUMNS]
+    values = ["" if v is None or (isinstance(v, float) and pd.isna(v)) else v for v in values]
+    values[1] = _to_int(values[1])
+    return [v if i == 1 else str(v) for i, v in enumerate(values)] + [to_date_key(row.get('取得日', ""))]
+
+
+# --- 関数: history.csv と履歴DBを揃える ---
+# DB作成時や history.csv が外部で書き換えられた場合は history.csv から作り直す
+def sync_history_db(conn, history_file):
+    digest = file_digest(history_file)
+    if _get_meta(conn, "csv_digest") == digest:
+        return False
+
+    print("履歴DBを history.csv から作成中...")
+    with conn:
+        conn.execute("DELETE FROM history")
+        if os.path.exists(history_file):
+            try:
+                df = pd.read_csv(history_file, encoding='utf-8-sig').fillna("")
+            except Exception as e:
+                print(f"履歴ファイルの読み込みエラー: {e}")
+                df = pd.DataFrame(columns=HISTORY_COLUMNS)
+            # 同じキーの行が複数あるのは順番のリセット後の行なので、出現順に世代を分ける
+            epochs = df.groupby([c for c in KEY_COLUMNS if c in df.columns], sort=False, dropna=False).cumcount() \
+                if all(c in df.columns for c in KEY_COLUMNS) else pd.Series(0, index=df.index)
+            rows = (
+                _row_values(row) + [int(epoch)]
+                for row, epoch in zip(df.to_dict("records"), epochs)
+            )
+            conn.executemany(
+                f"INSERT OR IGNORE INTO history ({_COLS_SQL}, date_key, epoch) VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 2))})",
+                rows,
+            )
+        _set_meta(conn, "csv_digest", digest)
+        # 作り直すと取り込み番号が振り直されるので、作り直した時の history.csv も残す
+        _set_meta(conn, "rebuilt_from", digest)
+    return True
+
+
+# --- 関数: 新しい行を履歴DBに追加 ---
+# new_df の temp_ingest 列 (room_fetcher.parse_page) で追加方法を決める
+#   "append": そのまま追加 (同じ世代に同じキーがあれば無視)
+#   "reset" : 部屋主の世代を1つ進めてから追加
+#   "merge" : どの世代にも同じキーが無い場合だけ追加
+# 戻り値は追加した行数
+def insert_history_rows(conn, new_df):
+    if new_df.empty:
+        return 0
+
+    owners = list(dict.fromkeys(new_df['部屋主']))
+    epochs = {}
+    for owner in owners:
+        row = conn.execute(f"SELECT MAX(epoch) FROM history WHERE {_q('部屋主')} = ?", (owner,)).fetchone()
+        epochs[owner] = row[0] or 0
+    reset_owners = set(new_df.loc[new_df['temp_ingest'] == "reset", '部屋主'])
+    for owner in reset_owners:
+        epochs[owner] += 1
+
+    insert_sql = (
+        f"INSERT OR IGNORE INTO history ({_COLS_SQL}, date_key, epoch) "
+        f"VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 2))})"
+    )
+    exists_sql = "SELECT 1 FROM history WHERE " + " AND ".join(f"{_q(c)} IS ?" for c in KEY_COLUMNS) + " LIMIT 1"
+    key_idx = [HISTORY_COLUMNS.index(c) for c in KEY_COLUMNS]
+
+    added = 0
+    with conn:
+        for row in new_df.to_dict("records"):
+            values = _row_values(row)
+            if row.get('temp_ingest') == "merge":
+                if conn.execute(exists_sql, [values[i] for i in key_idx]).fetchone():
+                    continue
+            cur = conn.execute(insert_sql, values + [epochs[row['部屋主']]])
+            added += cur.rowcount
+    return added
+
+
+# --- 関数: 履歴を DataFrame として読み込む (列の型は typed_history_frame) ---
+# start_date / end_date (YYYY-MM-DD, 両端を含む) と rooms、after_seq (これより後に取り込んだ行) で絞り込める
+def load_history(conn, start_date=None, end_date=None, rooms=None, after_seq=None):
+    where = []
+    params = []
+    if after_seq is not None:
+        where.append("seq > ?")
+        params.append(after_seq)
+    if start_date:
+        where.append("date_key >= ?")
+        params.append(start_date)
+    if end_date:
+        where.append("date_key <= ?")
+        params.append(end_date)
+    if rooms:
+        where.append(f"{_q('部屋主')} IN ({', '.join('?' * len(rooms))})")
+        params.extend(rooms)
+    sql = f"SELECT {_COLS_SQL} FROM history"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {_ORDER_SQL}"
+
+    rows = conn.execute(sql, params).fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(HISTORY_COLUMNS)
+    return typed_history_frame({c: intern_strings(values) for c, values in zip(HISTORY_COLUMNS, columns)})
+
+
+# --- 関数: 列の値を (重複しない値の一覧, 行ごとの番号) にする (空の値は None) ---
+def intern_strings(values):
+    codes, uniques = pd.factorize(np.array(values, dtype=object), use_na_sentinel=False)
+    return np.array([None if pd.isna(v) else v for v in uniques], dtype=object), codes.astype(np.int32)
+
+
+# --- 関数: 履歴の DataFrame を列の型を揃えて作る ---
+# columns: {列名: (重複しない値の一覧, 行ごとの番号)} (文字列の列の None は空文字、順番の列の値は整数か None)
+# 日付型の列は取得日の重複しない値ごとに1回だけ変換して作る
+def typed_history_frame(columns):
+    data = {}
+    for name, (uniques, codes) in columns.items():
+        if name == '順番':
+            if all(v is not None for v in uniques):
+                data[name] = uniques[codes].astype("int64")
+            else:
+                data[name] = np.array(["" if v is None else v for v in uniques], dtype=object)[codes]
+            continue
+        uniques = np.array(["" if v is None else v for v in uniques], dtype=object)
+        if name in CATEGORY_COLUMNS:
+            data[name] = pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+        else:
+            data[name] = uniques[codes]
+    uniques, codes = columns['取得日']
+    days = pd.to_datetime(pd.Series([to_date_key(v) for v in uniques], dtype=object), format="%Y-%m-%d")
+    data[HISTORY_DATE_COLUMN] = days.to_numpy(dtype="datetime64[ns]")[codes]
+    return pd.DataFrame(data)
+
+
+# --- 関数: 取得日の最初と最後 (YYYY-MM-DD, 履歴が無ければ None) ---
+def history_date_range(conn):
+    return conn.execute("SELECT MIN(date_key), MAX(date_key) FROM history").fetchone()
+
+
+# --- 関数: 部屋主ごとの最後の取得日 ({部屋主: YYYY-MM-DD}) ---
+def last_room_dates(conn):
+    return dict(conn.execute(f"SELECT {_q('部屋主')}, MAX(date_key) FROM history GROUP BY {_q('部屋主')}"))
+
+
+# --- 関数: 最後に取り込んだ行の取り込み番号 (履歴が無ければ 0) ---
+def max_history_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM history").fetchone()[0]
+
+
+# --- 関数: 履歴DBを最後に作り直した時の history.csv のハッシュ値 ---
+# 作り直すと取り込み番号が振り直されるので、取り込み番号を覚えておく側はこれも一緒に覚えておく
+def history_generation(conn):
+    return _get_meta(conn, "rebuilt_from")
+
+
+# --- 関数: 取得日の範囲 (両端を含む) の行の要約 ---
+# 行を読み込まずに、範囲の行が前回から変わったかを確かめるのに使う
+def history_range_summary(conn, start_date, end_date):
+    rows, first_seq, last_seq, order_total = conn.execute(
+        f"SELECT COUNT(*), MIN(seq), MAX(seq), TOTAL({_q('順番')}) FROM history WHERE date_key BETWEEN ? AND ?",
+        (start_date, end_date),
+    ).fetchone()
+    return {"rows": rows, "first_seq": first_seq, "last_seq": last_seq, "order_total": order_total,
+            "rebuilt_from": history_generation(conn)}
+
+
+# --- 関数: 履歴DBから history.csv を書き出す ---
+def export_history_csv(conn, history_file):
+    tmp_file = history_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(HISTORY_COLUMNS)
+        for row in conn.execute(f"SELECT {_COLS_SQL} FROM history ORDER BY {_ORDER_SQL}"):
+            writer.writerow(["" if v is None else v for v in row])
+    os.replace(tmp_file, history_file)
+    with conn:
+        _set_meta(conn, "csv_digest", file_digest(history_file))
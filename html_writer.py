@@ -0,0 +1,35 @@
+import os
+
+# --- 設定: 書き出しバッファの大きさ (この単位でまとめてファイルに書く) ---
+BUFFER_SIZE = 1 << 16
+
+
+# --- クラス: HTMLを断片ごとにファイルへ書き出す ---
+# 断片を1つの大きな文字列に連結せず、バッファ付きで順に書く
+# 書き終わるまでは一時ファイルに書き、最後に置き換える (途中で失敗しても前回の出力が残る)
+class HtmlWriter:
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.length = 0
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8", buffering=buffer_size)
+
+    def write(self, text):
+        self._file.write(text)
+        self.length += len(text)
+
+    # 断片を返すジェネレータなどをそのまま書く
+    def write_all(self, fragments):
+        for text in fragments:
+            self.write(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+        return False
@@ -0,0 +1,34 @@
+# --- クラス: 読み込み結果の置き場 (常駐モードで実行をまたいで使い回す) ---
+# 名前ごとに「入力のキー (ファイルのハッシュ値など)」と読み込み結果を1つずつ持ち、
+# キーが前回と同じなら読み込み直さない
+class LoadedInputs:
+    def __init__(self):
+        self._entries = {}
+
+    # --- 読み込み結果 (キーが違えば load() で読み込み直す) と、使い回したか ---
+    def get(self, name, key, load):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1], True
+        if entry is not None:
+            _close(entry[1])
+        value = load()
+        self._entries[name] = (key, value)
+        return value, False
+
+    # --- 読み込み結果を捨てる (次の get で読み込み直す) ---
+    def discard(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            _close(entry[1])
+
+    # --- 全て捨てる (履歴DBなど close できるものは閉じる) ---
+    def close(self):
+        for name in list(self._entries):
+            self.discard(name)
+
+
+def _close(value):
+    close = getattr(value, "close", None)
+    if callable(close):
+        close()
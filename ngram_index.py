@@ -0,0 +1,117 @@
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# --- 設定: n-gram 索引 ---
+# 日本語の曲名・作品名は短いので2文字単位で索引を作る
+NGRAM_SIZE = 2
+
+# re.IGNORECASE で同じ文字とみなされる組 (Python の正規表現エンジンと同じ)
+_IGNORECASE_EQUIVALENCES = (
+    (0x69, 0x131),            # i ı
+    (0x73, 0x17f),            # s ſ
+    (0xb5, 0x3bc),            # µ μ
+    (0x345, 0x3b9, 0x1fbe),   # ͅ ι ι
+    (0x390, 0x1fd3),          # ΐ ΐ
+    (0x3b0, 0x1fe3),          # ΰ ΰ
+    (0x3b2, 0x3d0),           # β ϐ
+    (0x3b5, 0x3f5),           # ε ϵ
+    (0x3b8, 0x3d1),           # θ ϑ
+    (0x3ba, 0x3f0),           # κ ϰ
+    (0x3c0, 0x3d6),           # π ϖ
+    (0x3c1, 0x3f1),           # ρ ϱ
+    (0x3c2, 0x3c3),           # ς σ
+    (0x3c6, 0x3d5),           # φ ϕ
+    (0x1e61, 0x1e9b),         # ṡ ẛ
+    (0xfb05, 0xfb06),         # ﬅ ﬆ
+)
+_EQUIVALENT_CHAR = {chr(c): chr(group[0]) for group in _IGNORECASE_EQUIVALENCES for c in group}
+# 英数字だけの検索語は前後が英数字でない場合だけ一致とする (部分一致の誤検出を防ぐ)
+_RE_ASCII_WORD = re.compile(r'^[A-Z0-9\s]+$')
+
+
+# --- クラス: 大文字小文字を区別しない比較用の文字変換表 ---
+# re.IGNORECASE で一致する文字同士が必ず同じ文字になるよう畳み込む
+# (出てきた文字だけを都度登録する)
+class _CaseFoldTable(dict):
+    def __missing__(self, key):
+        # 正規表現エンジンは1文字→1文字の小文字対応を使う (İ → i)
+        lower = chr(key).lower()[0]
+        value = _EQUIVALENT_CHAR.get(lower, lower)
+        self[key] = value
+        return value
+
+
+_CASE_FOLD_TABLE = _CaseFoldTable()
+
+
+# --- 関数: 大文字小文字を区別しない比較用に文字列を畳み込む (文字数は変わらない) ---
+def fold_case(text):
+    return text.translate(_CASE_FOLD_TABLE)
+
+
+# --- 関数: 検索語に対応する正規表現 (旧 check_match と同じ条件) ---
+def word_match_regex(target_text):
+    safe_target = re.escape(target_text)
+    if _RE_ASCII_WORD.match(target_text):
+        return re.compile(r'(?:^|[^A-Z0-9])' + safe_target + r'(?:[^A-Z0-9]|$)', re.IGNORECASE)
+    return re.compile(safe_target, re.IGNORECASE)
+
+
+# --- クラス: 正規化済み文字列の列に対する n-gram 転置索引 (大文字小文字を区別する) ---
+# 検索語の n-gram をすべて含む行だけを候補にし、候補の行だけを確かめる
+# 結果は Series.str.contains(..., regex=False, na=False) と同じ並びの bool 配列
+class NgramIndex:
+    def __init__(self, values, n=NGRAM_SIZE):
+        self.n = n
+        self._values = [v if isinstance(v, str) else None for v in values]
+        self._cache = {}
+        self.cache_hits = 0
+
+        postings = defaultdict(list)
+        for row, text in enumerate(self._values):
+            if not text:
+                continue
+            for gram in {text[i:i + n] for i in range(len(text) - n + 1)}:
+                postings[gram].append(row)
+        self._postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self._values)
+
+    # --- 検索語の n-gram をすべて含む行番号 (昇順) ---
+    def _candidates(self, literal):
+        grams = {literal[i:i + self.n] for i in range(len(literal) - self.n + 1)}
+        if not grams:
+            # n 文字未満の検索語は絞り込めないので全行を確かめる
+            return range(len(self._values))
+
+        lists = []
+        for gram in grams:
+            rows = self._postings.get(gram)
+            if rows is None:
+                return ()
+            lists.append(rows)
+        lists.sort(key=len)
+        result = lists[0]
+        for rows in lists[1:]:
+            result = np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    # --- 部分一致 (Series.str.contains(text, regex=False) と同じ) ---
+    def contains(self, text):
+        mask = self._cache.get(text)
+        if mask is not None:
+            self.cache_hits += 1
+            return mask
+        mask = np.zeros(len(self._values), dtype=bool)
+        values = self._values
+        for row in self._candidates(text):
+            value = values[row]
+            if value is not None and text in value:
+                mask[row] = True
+        self._cache[text] = mask
+        return mask
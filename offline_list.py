@@ -0,0 +1,141 @@
+import glob
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+
+from room_fetcher import file_digest
+from text_normalizer import normalize_many
+
+# --- 設定: オフラインリスト ---
+# 半期ごとのファイルを置けば自動で読み込む (新しいファイルから順)
+OFFLINE_FILE_PATTERN = "offline_list_*.csv"
+# 正規化済みの曲名の保存先 (実行間で保持し、変わっていないファイルは読み込まない)
+# ファイルごとに大きさ・更新日時・ハッシュ値を残し、末尾に行が追加されただけなら追加分だけ正規化する
+OFFLINE_CACHE_FILE = os.path.join(".cache", "offline_targets.json")
+
+
+# --- 関数: オフラインリストのファイル一覧 ---
+def discover_offline_files(pattern=OFFLINE_FILE_PATTERN):
+    return sorted(glob.glob(pattern), reverse=True)
+
+
+# --- 関数: 正規化済みの曲名の保存内容を読み込む (無い・壊れている場合は空) ---
+def load_offline_cache(cache_file=OFFLINE_CACHE_FILE):
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"オフラインリストのキャッシュの読み込みエラー: {e}")
+        return {}
+
+
+# --- 関数: 正規化済みの曲名を保存 ---
+def save_offline_cache(cache, cache_file=OFFLINE_CACHE_FILE):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _prefix_digest(path, size):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(1 << 20, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+# --- 関数: 保存内容と比べたファイルの状態 ---
+# 戻り値: (状態, ハッシュ値)
+#   "same"    : 大きさ・更新日時が同じ (ハッシュ値は計算しない)
+#   "touched" : 更新日時だけ変わった (内容は同じ)
+#   "appended": 末尾に行が追加された (前回の内容はそのまま)
+#   "changed" : それ以外 (初めて読む場合も含む)
+def _file_state(path, entry):
+    stat = _stat_key(path)
+    if entry and entry["stat"] == stat:
+        return "same", entry["sha256"]
+    digest = file_digest(path)
+    if entry and entry["sha256"] == digest:
+        return "touched", digest
+    if entry and entry["complete"] and stat[0] > entry["stat"][0] \
+            and _prefix_digest(path, entry["stat"][0]) == entry["sha256"]:
+        return "appended", digest
+    return "changed", digest
+
+
+# --- 関数: ファイルごとのハッシュ値 (大きさ・更新日時が保存時と同じならハッシュ値を計算しない) ---
+def offline_digests(files, cache):
+    return [(path, _file_state(path, cache.get(path))[1] if os.path.exists(path) else "") for path in files]
+
+
+# --- 関数: CSV の曲名列を正規化 (None: 曲名列が無い) ---
+def _read_targets(data):
+    df = pd.read_csv(io.BytesIO(data), dtype=str).fillna("")
+    if '曲名' not in df.columns:
+        return None
+    return normalize_many(df['曲名'].tolist(), offline=True)
+
+
+# --- 関数: オフラインリストの正規化済みの曲名 (ファイルごと) ---
+# cache (load_offline_cache の内容) を最新の状態に更新する
+# 戻り値: {ファイル名: 正規化済みの曲名のリスト} (読めないファイルは含まない)
+def load_offline_targets(files, cache):
+    targets_by_file = {}
+    for path in files:
+        if not os.path.exists(path):
+            print(f"オフラインリスト({path})が見つかりません。")
+            continue
+        entry = cache.get(path)
+        try:
+            state, digest = _file_state(path, entry)
+            if state == "same":
+                targets_by_file[path] = entry["targets"]
+                continue
+            if state == "touched":
+                targets = entry["targets"]
+            elif state == "appended":
+                with open(path, "rb") as f:
+                    header = f.readline()
+                    f.seek(entry["stat"][0])
+                    added = _read_targets(header + f.read())
+                targets = entry["targets"] + added
+                print(f"オフラインリスト({path})の追加分を読み込みました。追加件数: {len(added)}")
+            else:
+                with open(path, "rb") as f:
+                    data = f.read()
+                targets = _read_targets(data)
+                if targets is None:
+                    print(f"オフラインリスト({path})に'曲名'カラムが見つかりません。")
+                    continue
+                print(f"オフラインリスト({path})を読み込みました。追加件数: {len(targets)}")
+            # 末尾が改行で終わっていれば、次に追加された行だけを読める
+            with open(path, "rb") as f:
+                f.seek(max(0, os.path.getsize(path) - 1))
+                complete = f.read(1) in (b"\n", b"")
+            cache[path] = {"stat": _stat_key(path), "sha256": digest, "complete": complete, "targets": targets}
+        except Exception as e:
+            print(f"オフラインリスト({path})読み込みエラー: {e}")
+            continue
+        targets_by_file[path] = targets
+
+    # 無くなったファイルの分は消す
+    for path in [p for p in cache if p not in files]:
+        del cache[path]
+    return targets_by_file
@@ -0,0 +1,108 @@
+import re
+from collections import deque
+
+import numpy as np
+
+from ngram_index import fold_case, word_match_regex
+
+
+# --- クラス: 複数の検索語をまとめて探す Aho-Corasick オートマトン ---
+# 文字列を1回なぞるだけで、含まれている検索語をすべて見つける
+# (大文字小文字は fold_case で畳み込んだうえで比較する)
+class PatternAutomaton:
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        goto = [{}]
+        outputs = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in fold_case(pattern):
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(pattern_id)
+
+        # 失敗遷移: 幅優先で、一致しなかったときに戻る最長の接尾辞の状態を決める
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                outputs[nxt].extend(outputs[fail[nxt]])
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(o) for o in outputs]
+
+    # --- 文字列に含まれる検索語の番号の集合 ---
+    def find(self, text):
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set()
+        state = 0
+        for ch in fold_case(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+# --- クラス: クール集計の曲名・作品名と履歴の一致判定 ---
+# 全項目の検索語を1つのオートマトンにまとめ、履歴の各行 (同じ文字列は1回) を1回ずつなぞる
+# オートマトンで見つかった (行, 検索語) の組だけを旧判定と同じ正規表現で確かめる
+#   曲名: norm_filename に単語単位で一致 (英数字だけの曲名は前後が英数字でないこと)
+#   作品名: norm_filename か norm_workname に部分一致
+class CoolItemMatcher:
+    def __init__(self, filenames, worknames, patterns):
+        self._patterns = sorted({p for p in patterns if p})
+        self._automaton = PatternAutomaton(self._patterns)
+        self._word_hits = {}
+        self._contains_hits = {}
+
+        filename_hits = self._scan(filenames)
+        workname_hits = self._scan(worknames)
+        for pattern_id, pattern in enumerate(self._patterns):
+            word_regex = word_match_regex(pattern)
+            contains_regex = re.compile(re.escape(pattern), re.IGNORECASE)
+            fn_rows = filename_hits.get(pattern_id, [])
+            wn_rows = workname_hits.get(pattern_id, [])
+            self._word_hits[pattern] = np.array(
+                [row for row, text in fn_rows if word_regex.search(text)], dtype=np.int64)
+            self._contains_hits[pattern] = np.union1d(
+                np.array([row for row, text in fn_rows if contains_regex.search(text)], dtype=np.int64),
+                np.array([row for row, text in wn_rows if contains_regex.search(text)], dtype=np.int64),
+            )
+
+    # --- 列の各行をオートマトンに通し、検索語ごとに (行番号, 文字列) を集める ---
+    def _scan(self, values):
+        found_by_text = {}
+        hits = {}
+        for row, text in enumerate(values):
+            if not isinstance(text, str) or not text:
+                continue
+            found = found_by_text.get(text)
+            if found is None:
+                found = found_by_text[text] = self._automaton.find(text)
+            for pattern_id in found:
+                hits.setdefault(pattern_id, []).append((row, text))
+        return hits
+
+    # --- 曲名・作品名 (正規化済み) に一致する行番号 (昇順) ---
+    def match_rows(self, song_norm, anime_norm):
+        if song_norm and anime_norm:
+            return np.intersect1d(self._word_hits[song_norm], self._contains_hits[anime_norm], assume_unique=True)
+        if song_norm:
+            return self._word_hits[song_norm]
+        if anime_norm:
+            return self._contains_hits[anime_norm]
+        return np.array([], dtype=np.int64)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# --- 設定: 推移グラフに載せる順位 ---
+RANK_LIMIT = 20
+
+
+# --- 関数: 各行の値の順位 (同じ値は同順位、次の順位は飛ばす) ---
+# present が False のところは順位を数えない (結果は 0)
+def competition_ranks(values, present):
+    days, items = values.shape
+    if not items:
+        return np.zeros(values.shape, dtype=np.int64)
+    # 行ごとに検索できるよう、行番号ぶんずらした値を1列に並べる
+    masked = np.where(present, values, -1)
+    span = int(masked.max()) + 2
+    shifted = masked + 1 + np.arange(days)[:, None] * span
+    flat_sorted = np.sort(shifted, axis=None)
+    row_end = (np.arange(days) + 1) * span
+    greater = np.searchsorted(flat_sorted, row_end[:, None], side='left') - \
+        np.searchsorted(flat_sorted, shifted, side='right')
+    return np.where(present, greater + 1, 0)
+
+
+# --- 関数: 日ごとの累積歌唱数・累積人数ランキングの推移 ---
+# dates / item_ids / users は一致した履歴1行ずつの日付・項目番号・歌った人
+# names は項目番号ごとの表示名 (同じ名前の項目は同じ系列にまとめる)
+# weights は各行が表す歌唱数 (同じ内容の行をまとめた場合、省略時は1行1回)
+# 戻り値は (歌唱数の系列, 人数の系列)。系列は {名前: [{"x": 日付, "y": 順位}, ...]}
+def cumulative_rank_series(dates, item_ids, users, names, limit=RANK_LIMIT, weights=None):
+    if not len(item_ids):
+        return {}, {}
+
+    records = pd.DataFrame({
+        "date": pd.to_datetime(pd.Series(dates)).to_numpy(),
+        "item": np.asarray(item_ids, dtype=np.int64),
+        "user": list(users),
+        "weight": 1 if weights is None else np.asarray(weights, dtype=np.int64),
+    })
+    day_values, day_idx = np.unique(records["date"].to_numpy(), return_inverse=True)
+    item_values, item_col = np.unique(records["item"].to_numpy(), return_inverse=True)
+    records["day"] = day_idx.reshape(-1)
+    records["col"] = item_col.reshape(-1)
+    shape = (len(day_values), len(item_values))
+
+    # 日 × 項目の歌唱数と、その項目を初めて歌った人の数を累積する
+    counts = np.zeros(shape, dtype=np.int64)
+    np.add.at(counts, (records["day"].to_numpy(), records["col"].to_numpy()), records["weight"].to_numpy())
+    counts = counts.cumsum(axis=0)
+
+    first_days = records.groupby(["col", "user"], sort=False, dropna=False)["day"].min()
+    users_new = np.zeros(shape, dtype=np.int64)
+    np.add.at(users_new, (first_days.to_numpy(), first_days.index.get_level_values("col").to_numpy()), 1)
+    user_counts = users_new.cumsum(axis=0)
+
+    # 同じ値の並びは、その項目が初めて一致した順 (同じ日なら項目番号順)
+    first_seen = records.groupby("col")["day"].min().reindex(range(len(item_values))).to_numpy()
+    appear_order = np.lexsort((item_values, first_seen))
+    appear_key = np.empty(len(item_values), dtype=np.int64)
+    appear_key[appear_order] = np.arange(len(item_values))
+
+    day_labels = pd.DatetimeIndex(day_values).strftime("%Y-%m-%d").tolist()
+    present = counts > 0
+
+    def build_series(values):
+        ranks = competition_ranks(values, present)
+        rows, cols = np.nonzero(present & (ranks <= limit))
+        order = np.lexsort((appear_key[cols], -values[rows, cols], rows))
+        series = {}
+        for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+            name = names[item_values[col]]
+            if name not in series:
+                series[name] = []
+            series[name].append({"x": day_labels[row], "y": int(ranks[row, col])})
+        return series
+
+    return build_series(counts), build_series(user_counts)
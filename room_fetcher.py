@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from simplelist_parser import iter_chunks, iter_simplelist_records
+
+# --- 設定: 取得処理 ---
+URL_TEMPLATE = "http://Ykr.moe:{port}/simplelist.php"
+CONNECT_TIMEOUT = 10   # 秒: 1ポートあたりの接続待ち
+READ_TIMEOUT = 30      # 秒: 1ポートあたりの応答待ち
+RUN_DEADLINE = 120     # 秒: 全ポート取得の打ち切り時間 (cron間隔10分より十分短く)
+MAX_WORKERS = 16       # 同時接続数の上限
+
+# --- 設定: 取得キャッシュ (実行間で保持し、未変更のページは解析しない) ---
+FETCH_CACHE_FILE = os.path.join(".cache", "fetch_cache.json")
+
+# --- 設定: 既読位置 (ポートごとに最後に取り込んだ行の順番とハッシュ値) ---
+WATERMARK_HASH_COLUMNS = ['順番', '曲名（ファイル名）', '歌った人']
+
+
+# --- 関数: 共有セッション作成 (Keep-Alive接続を使い回す) ---
+def create_session(max_workers=MAX_WORKERS):
+    session = requests.Session()
+    # ポートごとに接続プールが作られるため、全ポート分を保持できる大きさにする
+    adapter = HTTPAdapter(pool_connections=64, pool_maxsize=max_workers, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# --- 関数: ファイルのハッシュ値 ---
+def file_digest(path):
+    if not os.path.exists(path):
+        return ""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --- 関数: 取得キャッシュ読み込み ---
+# 履歴ファイルがキャッシュ保存時と異なる場合 (保存前に異常終了した等) は
+# 取り込み漏れを防ぐため全ポートを取得し直す
+def load_fetch_cache(history_file, cache_file=FETCH_CACHE_FILE):
+    empty = {"history_digest": "", "ports": {}}
+    if not os.path.exists(cache_file):
+        return empty
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            cache = json.load(f)
+    except Exception as e:
+        print(f"取得キャッシュの読み込みエラー: {e}")
+        return empty
+    if cache.get("history_digest") != file_digest(history_file):
+        print("履歴ファイルが更新されているため取得キャッシュを破棄します。")
+        return empty
+    cache.setdefault("ports", {})
+    return cache
+
+
+# --- 関数: 取得キャッシュ保存 (履歴ファイル書き込み後に呼ぶ) ---
+def save_fetch_cache(cache, history_file, cache_file=FETCH_CACHE_FILE):
+    cache["history_digest"] = file_digest(history_file)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_file, cache_file)
+
+
+# --- 関数: 1ポート分のページ取得 ---
+# ETag / Last-Modified があれば条件付きリクエストを送り、
+# 応答が 304 または前回と同じ内容なら None を返す
+def fetch_page(session, port, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), entry=None):
+    url = URL_TEMPLATE.format(port=port)
+    entry = entry or {}
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = session.get(url, timeout=timeout, headers=headers)
+    if response.status_code == 304:
+        return None, entry
+    response.raise_for_status()
+
+    content = response.content
+    new_entry = {
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+    if new_entry["sha256"] == entry.get("sha256"):
+        return None, new_entry
+    return content, new_entry
+
+
+# --- 関数: 行のハッシュ値 (既読位置の照合用) ---
+def row_hash(record):
+    key = "\t".join(str(record.get(col, "")) for col in WATERMARK_HASH_COLUMNS)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+# --- 関数: 既読位置より新しい行だけを取り出す ---
+# 戻り値は (行のリスト, 取り込み方法, 新しい既読位置)
+#   "append": 既読位置より後の行だけ (過去データとの重複確認は不要)
+#   "reset" : 部屋の順番が振り直された。ページの全行が新しい行
+#   "merge" : 既読位置が無い・判定できない。過去データと重複確認して取り込む
+# ページが順番の降順なら、既読位置の行まで読んだ時点で解析を打ち切る
+def take_new_records(records, watermark):
+    mark = watermark["順番"] if watermark else None
+    seen = []
+    newer = []
+    latest = None
+    mark_row_hash = None
+    descending = True
+
+    for record in records:
+        num = record.get("順番")
+        if not isinstance(num, int):
+            # 順番が数値でない行があれば既読位置は使えない
+            seen.append(record)
+            seen.extend(records)
+            return seen, "merge", None
+        if seen and num > seen[-1]["順番"]:
+            descending = False
+        seen.append(record)
+        if latest is None or num > latest["順番"]:
+            latest = record
+        if mark is None:
+            continue
+        if num > mark:
+            newer.append(record)
+        elif num == mark:
+            mark_row_hash = row_hash(record)
+            if mark_row_hash == watermark["row_hash"] and descending:
+                break
+
+    new_watermark = {"順番": latest["順番"], "row_hash": row_hash(latest)} if latest else watermark
+    if mark is None:
+        return seen, "merge", new_watermark
+    if not seen:
+        return [], "append", watermark
+    if mark_row_hash is not None:
+        if mark_row_hash == watermark["row_hash"]:
+            return newer, "append", new_watermark
+        # 同じ順番に別の曲がある = 順番が振り直された
+        return seen, "reset", new_watermark
+    if min(r["順番"] for r in seen) > mark:
+        # 前回から曲数が多くページから既読位置が流れた
+        return seen, "append", new_watermark
+    if latest["順番"] < mark:
+        return seen, "reset", new_watermark
+    return seen, "merge", new_watermark
+
+
+# --- 関数: 取得したページを部屋ごとのDataFrameに変換 ---
+# (見出しの繰り返し行は解析時に除かれる)
+# 取り込み方法は temp_ingest 列に入れる (マージ後に削除する)
+def parse_page(content, owner, fetch_date, watermark=None):
+    header = []
+    records = iter_simplelist_records(iter_chunks(content), on_header=header.extend)
+    rows, mode, new_watermark = take_new_records(records, watermark)
+    if not header:
+        return None, watermark
+    df = pd.DataFrame.from_records(rows, columns=header)
+    df['部屋主'] = owner
+    df['取得日'] = fetch_date
+    df['temp_ingest'] = mode
+    return df, new_watermark
+
+
+# --- 関数: 全ポートを並列取得 ---
+# 戻り値は room_map の順に並んだ部屋ごとのDataFrameのリスト
+# (同じ部屋主の複数ポート間の重複排除で keep='first' の結果を変えないため順序を保つ)
+# cache を渡すと未変更のポートは解析せずに読み飛ばし、cache を最新の状態に更新する
+# stats を渡すと更新・未変更・失敗・打ち切りの件数と、取得できたポートごとの新しい行数 (new_rows) を入れる
+# (既読位置が無く過去データとの照合が必要な "merge" のポートは行数を数えられないので None)
+def fetch_rooms(room_map, fetch_date, cache=None, max_workers=MAX_WORKERS,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), deadline=RUN_DEADLINE, stats=None):
+    target_ports = list(room_map.keys())
+    port_cache = cache["ports"] if cache is not None else {}
+    results = {}
+    unchanged = []
+    failed = []
+    new_rows = {}
+    started = time.monotonic()
+
+    session = create_session(max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {
+            executor.submit(fetch_page, session, port, timeout, port_cache.get(str(port))): port
+            for port in target_ports
+        }
+        while pending:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                port = pending.pop(future)
+                try:
+                    content, entry = future.result()
+                    watermark = port_cache.get(str(port), {}).get("watermark")
+                    if content is not None:
+                        df, watermark = parse_page(content, room_map[port], fetch_date, watermark)
+                        new_rows[port] = 0
+                        if df is not None:
+                            results[port] = df
+                            if len(df):
+                                new_rows[port] = None if df['temp_ingest'].iloc[0] == "merge" else len(df)
+                    else:
+                        unchanged.append(port)
+                        new_rows[port] = 0
+                    entry["watermark"] = watermark
+                    port_cache[str(port)] = entry
+                except Exception:
+                    failed.append(port)
+    finally:
+        # 打ち切り時は未完了の取得を待たずに進む (各取得はタイムアウトで必ず終わる)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    timed_out = sorted(pending.values())
+    elapsed = time.monotonic() - started
+    print(f"取得完了: 更新 {len(results)} / 未変更 {len(unchanged)} / 失敗 {len(failed)} / 打ち切り {len(timed_out)} ({elapsed:.1f}秒)")
+    for port, df in results.items():
+        if len(df) and df['temp_ingest'].iloc[0] == "reset":
+            print(f"順番のリセットを検出: {room_map[port]} (ポート {port})")
+    if stats is not None:
+        stats.update(updated=len(results), unchanged=len(unchanged), failed=len(failed), timed_out=len(timed_out),
+                     new_rows=new_rows)
+
+    return [results[port] for port in target_ports if port in results]
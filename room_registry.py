@@ -0,0 +1,91 @@
+import datetime
+
+import pandas as pd
+
+# --- 設定: 部屋の一覧 (rooms.csv) ---
+# 列: ポート, 部屋主, 最大間隔（分） (空欄なら DEFAULT_MAX_INTERVAL)
+ROOM_COLUMNS = ['ポート', '部屋主', '最大間隔（分）']
+
+# --- 設定: 取得間隔の調整 ---
+# 新しい行が出ている部屋は毎回取得し、出ていない部屋は取得するたびに間隔を倍にする (最大間隔まで)
+RUN_INTERVAL = 10 * 60            # 秒: 実行間隔 (cron の間隔)
+DEFAULT_MAX_INTERVAL = 60 * 60    # 秒: 取得間隔の上限 (これより古い状態のままにはしない)
+ACTIVE_WINDOW = 60 * 60           # 秒: 最後に新しい行が出てからこの間は毎回取得
+ACTIVE_RATE = 1.0                 # 行/時: 今の時間帯の平均がこれ以上なら毎回取得
+RATE_WEIGHT = 0.2                 # 時間帯ごとの平均を新しい取得結果で更新する重み
+DORMANT_DAYS = 7                  # 日: 履歴にこれより新しい行が無い部屋は最初から最大間隔
+
+
+# --- 関数: 部屋の一覧を読み込む ---
+# 戻り値: {ポート: {"owner": 部屋主, "max_interval": 取得間隔の上限 (秒)}} (ファイルの順)
+def load_room_registry(path):
+    try:
+        df = pd.read_csv(path, encoding='utf-8-sig', dtype=str).fillna("")
+    except Exception as e:
+        print(f"部屋一覧の読み込みエラー: {e}")
+        return {}
+    rooms = {}
+    for record in df.to_dict("records"):
+        port = record.get('ポート', "").strip()
+        owner = record.get('部屋主', "").strip()
+        if not port.isdigit() or not owner:
+            continue
+        minutes = record.get('最大間隔（分）', "").strip()
+        rooms[int(port)] = {
+            "owner": owner,
+            "max_interval": int(float(minutes) * 60) if minutes else DEFAULT_MAX_INTERVAL,
+        }
+    return rooms
+
+
+# --- 関数: 今回取得する間隔 (秒、0 なら毎回) ---
+# state: 前回までの取得結果 (record_polls で更新するもの)、last_date: 履歴にある部屋主の最後の取得日
+# run_interval: 実行間隔 (常駐モードでは取得の周期)
+def poll_interval(state, now, max_interval, last_date=None, run_interval=RUN_INTERVAL):
+    if not state:
+        return 0
+    timestamp = now.timestamp()
+    if timestamp - state.get("last_new", 0) < ACTIVE_WINDOW or state["rates"][now.hour] >= ACTIVE_RATE:
+        return 0
+    if last_date is None or last_date < (now.date() - datetime.timedelta(days=DORMANT_DAYS)).isoformat():
+        return max_interval
+    return min(max_interval, run_interval * 2 ** state.get("idle_polls", 0))
+
+
+# --- 関数: 今回取得する部屋のポート (rooms の順) ---
+# schedule: {ポート (文字列): 取得結果}、last_dates: {部屋主: 履歴の最後の取得日 (YYYY-MM-DD)}
+# 実行の時刻は前後にずれるので、前回から (間隔 - 実行間隔の半分) 経っていれば取得する
+def due_ports(rooms, schedule, now, last_dates, run_interval=RUN_INTERVAL):
+    due = []
+    for port, room in rooms.items():
+        state = schedule.get(str(port))
+        interval = poll_interval(state, now, room["max_interval"], last_dates.get(room["owner"]), run_interval)
+        if not state or now.timestamp() - state["last_polled"] >= interval - run_interval / 2:
+            due.append(port)
+    return due
+
+
+# --- 関数: 取得結果を記録する ---
+# new_rows: {ポート: 新しい行数 (既読位置が無く数えられない場合は None)} (取得できたポートのみ)
+def record_polls(schedule, now, new_rows, run_interval=RUN_INTERVAL):
+    timestamp = now.timestamp()
+    for port, rows in new_rows.items():
+        state = schedule.setdefault(str(port), {"last_polled": timestamp, "last_new": 0, "idle_polls": 0,
+                                                "rates": [0.0] * 24})
+        if rows is not None:
+            # 前回の取得からの行数を時間あたりにして、今の時間帯の平均に入れる
+            hours = max(timestamp - state["last_polled"], run_interval) / 3600
+            rate = state["rates"][now.hour]
+            state["rates"][now.hour] = rate + RATE_WEIGHT * (rows / hours - rate)
+        if rows is None or rows > 0:
+            state["last_new"] = timestamp
+            state["idle_polls"] = 0
+        else:
+            state["idle_polls"] += 1
+        state["last_polled"] = timestamp
+
+
+# --- 関数: 一覧から無くなった部屋の取得結果を消す ---
+def prune_schedule(schedule, rooms):
+    for port in [p for p in schedule if int(p) not in rooms]:
+        del schedule[port]
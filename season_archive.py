@@ -0,0 +1,147 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from history_frame import pack_strings, unpack_strings
+from history_store import load_history, history_date_range, history_range_summary
+
+# --- 設定: クールごとの履歴アーカイブ ---
+# 終わったクールの履歴は集計用の行 (正規化・除外済み) を同じ内容ごとにまとめて1ファイルにし、
+# 毎回の集計では今のクールの履歴だけを読み込んで正規化する
+ARCHIVE_DIR = os.path.join(".cache", "archive")
+# アーカイブの形式 (変えたら全クール作り直す)
+ARCHIVE_FORMAT = 1
+SEASON_NAMES = ["冬", "春", "夏", "秋"]
+# アーカイブに持つ集計用の列 (取得日 dt_obj と件数 weight のほか)
+ARCHIVE_COLUMNS = ['norm_filename', 'norm_workname', '歌った人']
+
+
+# --- 関数: 日付を含むクールの最初の日 (1・4・7・10月の1日) ---
+def season_start(day):
+    return datetime.date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+
+
+# --- 関数: 次のクールの最初の日 ---
+def next_season_start(start):
+    month = start.month + 3
+    return datetime.date(start.year + (month > 12), (month - 1) % 12 + 1, 1)
+
+
+# --- 関数: クールの表示名 (例: 2026年冬) ---
+def season_name(start):
+    return f"{start.year}年{SEASON_NAMES[(start.month - 1) // 3]}"
+
+
+# --- 関数: 終わったクール (hot_start より前) の一覧 [(最初の日, 最後の日), ...] ---
+def closed_seasons(conn, hot_start):
+    first_key, _ = history_date_range(conn)
+    if first_key is None:
+        return []
+    seasons = []
+    start = season_start(datetime.date.fromisoformat(first_key))
+    while start < hot_start:
+        end = next_season_start(start)
+        seasons.append((start, end - datetime.timedelta(days=1)))
+        start = end
+    return seasons
+
+
+def _empty_rows():
+    return pd.DataFrame({
+        'dt_obj': pd.Series([], dtype="datetime64[ns]"),
+        **{c: pd.Series([], dtype=object) for c in ARCHIVE_COLUMNS},
+        'weight': pd.Series([], dtype="int64"),
+    })
+
+
+# --- 関数: 集計用の行を同じ内容 (日付・正規化済みの曲名・作品名・歌った人) ごとにまとめる ---
+def _group_rows(rows):
+    if rows.empty:
+        return _empty_rows()
+    keys = pd.DataFrame({
+        'day': rows['dt_obj'].to_numpy().astype("datetime64[D]"),
+        **{c: rows[c].astype(str).to_numpy() for c in ARCHIVE_COLUMNS},
+    })
+    grouped = keys.groupby(['day'] + ARCHIVE_COLUMNS, sort=True).size().reset_index(name='weight')
+    grouped['dt_obj'] = grouped.pop('day').astype("datetime64[ns]")
+    grouped['weight'] = grouped['weight'].astype("int64")
+    return grouped[['dt_obj'] + ARCHIVE_COLUMNS + ['weight']]
+
+
+# --- 関数: アーカイブを書き出す (文字列は全列共通の辞書 + 番号で持つ) ---
+def _write_archive(path, grouped, meta):
+    codes, uniques = pd.factorize(pd.concat([grouped[c] for c in ARCHIVE_COLUMNS], ignore_index=True))
+    text, text_lengths = pack_strings(uniques)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(
+            f,
+            meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+            text=text,
+            text_lengths=text_lengths,
+            day=grouped['dt_obj'].to_numpy().astype("datetime64[D]").astype(np.int64),
+            codes=codes.astype(np.int32).reshape(len(ARCHIVE_COLUMNS), -1),
+            weight=grouped['weight'].to_numpy(dtype=np.int64),
+        )
+    os.replace(tmp_file, path)
+
+
+# --- 関数: アーカイブを読み込む ---
+# 戻り値: (作成時の情報, 集計用の行の DataFrame)。読めない場合は (None, None)
+def read_archive(path):
+    try:
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            texts = unpack_strings(data["text"], data["text_lengths"])
+            codes = data["codes"]
+            rows = pd.DataFrame({
+                'dt_obj': data["day"].astype("datetime64[D]").astype("datetime64[ns]"),
+                **{c: texts[codes[i]] if len(texts) else np.array([], dtype=object)
+                   for i, c in enumerate(ARCHIVE_COLUMNS)},
+                'weight': data["weight"],
+            })
+    except Exception as e:
+        print(f"アーカイブの読み込みエラー ({path}): {e}")
+        return None, None
+    return meta, rows
+
+
+# --- 関数: 終わったクールの集計用の行を読み込む ---
+# 無い・古い (履歴の行や version が変わった) クールは、履歴DBから読み込んで作り直す
+# prepare: 履歴の DataFrame から集計用の行 (dt_obj と ARCHIVE_COLUMNS の列、除外済み) を作る関数
+# version: prepare の処理のキー (正規化・除外の処理を変えたら全クール作り直す)
+# 戻り値: (全クールの集計用の行 (weight 列 = まとめた行数), {"loaded": 読み込んだ数, "built": 作り直した数})
+def load_season_archives(conn, hot_start, version, prepare, archive_dir=ARCHIVE_DIR):
+    frames = []
+    stats = {"loaded": 0, "built": 0}
+    paths = set()
+    for start, end in closed_seasons(conn, hot_start):
+        source = history_range_summary(conn, start.isoformat(), end.isoformat())
+        if not source["rows"]:
+            continue
+        path = os.path.join(archive_dir, f"{start:%Y-%m}.npz")
+        paths.add(path)
+        expected = {"format": ARCHIVE_FORMAT, "season": season_name(start), "version": version, "source": source}
+        meta, rows = read_archive(path) if os.path.exists(path) else (None, None)
+        if meta == expected:
+            stats["loaded"] += 1
+        else:
+            print(f"{season_name(start)}の履歴アーカイブを作成中...")
+            rows = _group_rows(prepare(load_history(conn, start.isoformat(), end.isoformat())))
+            _write_archive(path, rows, expected)
+            stats["built"] += 1
+        frames.append(rows)
+
+    # 履歴から無くなったクールのアーカイブは削除
+    if os.path.isdir(archive_dir):
+        for name in os.listdir(archive_dir):
+            path = os.path.join(archive_dir, name)
+            if name.endswith(".npz") and path not in paths:
+                os.remove(path)
+
+    rows = pd.concat(frames, ignore_index=True) if frames else _empty_rows()
+    return rows, stats
@@ -0,0 +1,179 @@
+import base64
+import datetime
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+from history_store import to_date_key
+from ngram_index import NGRAM_SIZE
+from text_normalizer import fold_search_text
+
+# 取得日が読めない行をまとめるシャード名
+UNDATED_SHARD = "undated"
+# 検索索引のファイル名 (シャードと同じ場所に置く)
+SEARCH_INDEX_FILE = "search.json"
+# これより多くのセル値に出てくる n-gram は絞り込みに役立たないので、名前だけ残して一覧は持たない
+COMMON_GRAM_RATIO = 0.25
+
+
+# --- 関数: セットリスト表の見出しHTML (列をクリックで並べ替え) ---
+def render_setlist_headers(columns):
+    return "".join(
+        f'<th onclick="sortTable({i})">{col} <i class="fas fa-sort"></i></th>'
+        for i, col in enumerate(columns)
+    )
+
+
+# --- 関数: 取得日の並べ替えキー (日付の順、読めない値は後ろ) ---
+def _date_sort_key(text):
+    key = to_date_key(text)
+    if key is None:
+        return (1, 0)
+    return (0, datetime.date.fromisoformat(key).toordinal())
+
+
+# --- 関数: 取得日の値ごとの並べ替え順位 (同じ順位は同じ値) ---
+def _date_ranks(values):
+    ordered = sorted(set(values), key=lambda value: (_date_sort_key(value), value))
+    return {value: rank for rank, value in enumerate(ordered)}
+
+
+# --- 関数: 1列分を列指向のJSON用データに変換 ---
+# 整数列はそのまま数値配列 (値がそのまま並べ替えキー)、それ以外は辞書 (重複しない文字列) + 番号の配列にする
+# 取得日の列は辞書の値ごとに全シャード共通の並べ替え順位 (keys) を付ける
+# (文字列の列の順位はブラウザで Intl.Collator('ja') を使って決める)
+def _encode_column(values, is_integer, ranks):
+    if is_integer:
+        return {"values": [int(v) for v in values]}
+    lookup = {}
+    codes = []
+    for v in values:
+        text = f'{v}'
+        code = lookup.get(text)
+        if code is None:
+            code = lookup[text] = len(lookup)
+        codes.append(code)
+    column = {"dict": list(lookup), "codes": codes}
+    if ranks is not None:
+        column["keys"] = [ranks[text] for text in lookup]
+    return column
+
+
+# --- 関数: 昇順の番号の一覧をまとめて可変長整数 (7bitずつ) の base64 にする ---
+# 一覧ごとに [件数, 先頭の番号, 差分, 差分, ...] の順に並べる
+def _pack_id_lists(id_lists):
+    out = bytearray()
+    for ids in id_lists:
+        for value in [len(ids)] + [i - p for p, i in zip([0] + ids[:-1], ids)]:
+            while value >= 0x80:
+                out.append((value & 0x7f) | 0x80)
+                value >>= 7
+            out.append(value)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+# --- 関数: 検索ボックス用の n-gram 転置索引 ---
+# 行番号はシャードを manifest の順に連結したときの通し番号 (= df の行順)
+# セル値 (全列で共通の番号) → n-gram、セル値 → 行 の2段で持ち、
+# 検索語の n-gram の一覧の共通部分から候補のセル値、さらに候補の行を求める
+def build_search_index(df, n=NGRAM_SIZE):
+    value_ids = {}
+    value_rows = []
+    for row, values in enumerate(df.itertuples(index=False, name=None)):
+        for v in values:
+            text = f'{v}'
+            vid = value_ids.get(text)
+            if vid is None:
+                vid = value_ids[text] = len(value_rows)
+                value_rows.append([])
+            rows = value_rows[vid]
+            if not rows or rows[-1] != row:
+                rows.append(row)
+
+    postings = defaultdict(list)
+    for vid, text in enumerate(value_ids):
+        key = fold_search_text(text)
+        for gram in {key[i:i + n] for i in range(len(key) - n + 1)}:
+            postings[gram].append(vid)
+
+    limit = max(1, int(len(value_rows) * COMMON_GRAM_RATIO))
+    grams = [g for g in sorted(postings) if len(postings[g]) <= limit]
+    return {
+        "n": n,
+        "common": sorted(g for g, ids in postings.items() if len(ids) > limit),
+        # n 文字ずつ連結した n-gram と、同じ順のセル値番号の一覧
+        "grams": "".join(grams),
+        "postings": _pack_id_lists([postings[g] for g in grams]),
+        "rows": _pack_id_lists(value_rows),
+    }
+
+
+# --- 関数: セットリストを取得月ごとのシャードに分割 ---
+# 戻り値: (manifest, {ファイル名: JSON文字列})
+# シャードは新しい月から順に並び、連結すると df と同じ行順になる (df は取得日の降順)
+def build_setlist_shards(df):
+    columns = [str(c) for c in df.columns]
+    if df.empty:
+        return {"version": "", "columns": columns, "total": 0, "shards": [], "search": SEARCH_INDEX_FILE}, {}
+
+    integer_cols = [str(df[c].dtype).startswith(("int", "uint")) for c in df.columns]
+    # 取得日の並べ替え順位は全行で決めてから各シャードに配る
+    ranks = [
+        _date_ranks([f'{v}' for v in df.iloc[:, c]]) if columns[c] == '取得日' and not integer_cols[c] else None
+        for c in range(len(columns))
+    ]
+    if '取得日' in df.columns:
+        month_of = {v: (to_date_key(v) or "")[:7] or UNDATED_SHARD for v in set(df['取得日'])}
+        months = [month_of[v] for v in df['取得日']]
+    else:
+        months = [UNDATED_SHARD] * len(df)
+
+    positions = {}
+    for i, month in enumerate(months):
+        positions.setdefault(month, []).append(i)
+    # 月の降順、読めない取得日は最後
+    dated = sorted((m for m in positions if m != UNDATED_SHARD), reverse=True)
+    order = dated + ([UNDATED_SHARD] if UNDATED_SHARD in positions else [])
+
+    digest = hashlib.sha1()
+    files = {}
+    shards = []
+    for month in order:
+        part = df.iloc[positions[month]]
+        payload = {
+            "rows": len(part),
+            "columns": [_encode_column(part.iloc[:, c].tolist(), integer_cols[c], ranks[c])
+                        for c in range(len(columns))],
+        }
+        text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        name = f"{month}.json"
+        files[name] = text
+        digest.update(text.encode("utf-8"))
+        shards.append({"file": name, "rows": len(part)})
+
+    text = json.dumps(build_search_index(df), ensure_ascii=False, separators=(",", ":"))
+    files[SEARCH_INDEX_FILE] = text
+    digest.update(text.encode("utf-8"))
+
+    manifest = {"version": digest.hexdigest()[:12], "columns": columns, "total": len(df), "shards": shards,
+                "search": SEARCH_INDEX_FILE}
+    return manifest, files
+
+
+# --- 関数: シャードを書き出す (内容が同じファイルは書き換えず、使われなくなったシャードは削除) ---
+def write_setlist_shards(df, out_dir):
+    manifest, files = build_setlist_shards(df)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, text in files.items():
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                if f.read() == text:
+                    continue
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    for name in os.listdir(out_dir):
+        if name.endswith(".json") and name not in files:
+            os.remove(os.path.join(out_dir, name))
+    return manifest
@@ -0,0 +1,193 @@
+import codecs
+import html
+import re
+
+# --- 設定: simplelist.php の表 ---
+# 表の途中に繰り返し出てくる見出し行を判定する列
+HEADER_CHECK_COLUMNS = ['曲名（ファイル名）', '作品名', '歌手名']
+# 整数として扱う列
+INT_COLUMNS = ['順番']
+# 一度に解析するバイト数
+CHUNK_SIZE = 64 * 1024
+# pd.read_html が欠損値とみなす文字列 (空文字として扱う)
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+# pd.read_html と同じ空白の詰め方 (改行・連続空白を1つの空白に)
+_RE_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+_RE_INT = re.compile(r"[+-]?[0-9]+")
+_RE_TAG = re.compile(r"<[A-Za-z/!?][^>]*>")
+_RE_TABLE_START = re.compile(r"<table\b[^>]*>", re.I)
+_RE_TABLE_END = re.compile(r"</table\s*>", re.I)
+_RE_ROW_START = re.compile(r"<tr\b[^>]*>", re.I)
+_RE_ROW_END = re.compile(r"</tr\s*>", re.I)
+_RE_CELL_START = re.compile(r"<t[dh]\b([^>]*)>", re.I)
+_RE_CELL_END = re.compile(r"</t[dh]\s*>", re.I)
+_RE_COLSPAN = re.compile(r"colspan\s*=\s*[\"']?([0-9]+)", re.I)
+_RE_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_\-]+)', re.I)
+
+
+# --- 関数: ページの文字コード判定 ---
+# meta の charset を優先し、無ければ UTF-8 → CP932 の順で試す
+def detect_encoding(head):
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    match = _RE_META_CHARSET.search(head[:4096])
+    encodings = [match.group(1).decode('ascii')] if match else []
+    encodings += ['utf-8', 'cp932']
+    for enc in encodings:
+        try:
+            # 先頭のかたまりが文字の途中で切れていても判定できるよう逐次デコーダで試す
+            codecs.getincrementaldecoder(enc)().decode(head, final=False)
+            return enc
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return 'utf-8'
+
+
+# --- 関数: 1セル分のHTMLを文字列に変換 ---
+def _cell_text(fragment):
+    if '<' in fragment:
+        fragment = _RE_TAG.sub('', fragment)
+    if '&' in fragment:
+        fragment = html.unescape(fragment)
+    return _RE_WHITESPACE.sub(" ", fragment.strip())
+
+
+# --- 関数: 1行分のHTML (<tr>以降) をセルの値のリストに変換 ---
+# 終了タグが省略された <td> も次の <td> で区切る
+def _split_row(fragment):
+    parts = _RE_CELL_START.split(fragment)
+    values = []
+    # parts = [行頭, 属性, 中身, 属性, 中身, ...]
+    for i in range(1, len(parts) - 1, 2):
+        attrs, body = parts[i], parts[i + 1]
+        end = _RE_CELL_END.search(body)
+        text = _cell_text(body[:end.start()] if end else body)
+        colspan = 1
+        if attrs and 'colspan' in attrs:
+            m = _RE_COLSPAN.search(attrs)
+            colspan = int(m.group(1)) if m else 1
+        values.extend([text] * colspan)
+    return values
+
+
+# --- クラス: 最初の<table>の<tr>を1行ずつ切り出す ---
+# 受け取った文字列を溜めておき、閉じた行から順に取り出す
+class _TableRowScanner:
+    def __init__(self):
+        self.finished = False   # 最初の表を読み終えたか
+        self._buf = ""
+        self._in_table = False
+
+    def feed(self, text):
+        if self.finished:
+            return []
+        self._buf += text
+        if not self._in_table:
+            m = _RE_TABLE_START.search(self._buf)
+            if not m:
+                # 開始タグが分割されていても見つけられるよう末尾だけ残す
+                self._buf = self._buf[-16:]
+                return []
+            self._buf = self._buf[m.end():]
+            self._in_table = True
+        end = _RE_TABLE_END.search(self._buf)
+        return self._drain(end.start() if end else None)
+
+    def close(self):
+        if self.finished or not self._in_table:
+            return []
+        return self._drain(len(self._buf))
+
+    # limit が None の場合、最後の <tr> 以降はまだ途中の可能性があるので次回に回す
+    def _drain(self, limit):
+        buf = self._buf
+        starts = list(_RE_ROW_START.finditer(buf, 0, len(buf) if limit is None else limit))
+        if limit is None:
+            complete, self._buf = starts[:-1], buf[starts[-1].start():] if starts else buf
+        else:
+            complete, self._buf = starts, ""
+            self.finished = True
+
+        rows = []
+        for i, m in enumerate(complete):
+            seg_end = starts[i + 1].start() if i + 1 < len(starts) else limit
+            segment = buf[m.end():seg_end]
+            end = _RE_ROW_END.search(segment)
+            values = _split_row(segment[:end.start()] if end else segment)
+            if values:
+                rows.append(values)
+        return rows
+
+
+# --- 関数: 1行分の値を型付きのレコードに変換 ---
+def _to_record(header, values):
+    record = {}
+    for i, col in enumerate(header):
+        val = values[i] if i < len(values) else ""
+        if val in NA_VALUES:
+            val = ""
+        if col in INT_COLUMNS and _RE_INT.fullmatch(val):
+            val = int(val)
+        record[col] = val
+    return record
+
+
+# --- 関数: simplelist.php の表をレコードとして順に返す ---
+# chunks は文字列・バイト列、またはそれらの反復可能オブジェクト
+# 1行目を見出しとし、表の途中に繰り返される見出し行は読み飛ばす
+# on_header を渡すと見出しを読んだ時点で列名のリストを渡して呼ぶ
+def iter_simplelist_records(chunks, on_header=None):
+    if isinstance(chunks, (str, bytes)):
+        chunks = [chunks]
+
+    scanner = _TableRowScanner()
+    decoder = None
+    header = None
+    check_idx = []
+
+    def to_records(rows):
+        nonlocal header, check_idx
+        for values in rows:
+            if header is None:
+                header = values
+                check_idx = [i for i, col in enumerate(header) if col in HEADER_CHECK_COLUMNS]
+                if on_header is not None:
+                    on_header(list(header))
+                continue
+            if any(i < len(values) and values[i] == header[i] for i in check_idx):
+                continue
+            yield _to_record(header, values)
+
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(detect_encoding(chunk))(errors='replace')
+            chunk = decoder.decode(chunk)
+        yield from to_records(scanner.feed(chunk))
+        if scanner.finished:
+            return
+
+    if decoder is not None:
+        yield from to_records(scanner.feed(decoder.decode(b'', final=True)))
+    yield from to_records(scanner.close())
+
+
+# --- 関数: バイト列を CHUNK_SIZE ごとに区切る (ページ全体の文字列を作らない) ---
+def iter_chunks(content, size=CHUNK_SIZE):
+    if not isinstance(content, bytes):
+        yield content
+        return
+    view = memoryview(content)
+    for i in range(0, len(view), size):
+        yield bytes(view[i:i + size])
+
+
+# --- 関数: simplelist.php の見出しとレコード一覧を返す ---
+def parse_simplelist(content):
+    header = []
+    records = list(iter_simplelist_records(iter_chunks(content), on_header=header.extend))
+    return header, records
@@ -0,0 +1,43 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+# --- クラス: 処理段階ごとの所要時間・入出力件数・キャッシュ利用の記録 ---
+# with recorder.stage("名前", rows_in=...) as st: の中で st["rows_out"] などを埋める
+class StageRecorder:
+    def __init__(self):
+        self.stages = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = {"stage": name, "seconds": 0.0, "rows_in": rows_in, "rows_out": None, "cache_hits": None}
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record["error"] = True
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            self.stages.append(record)
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self._started
+
+    def print_summary(self):
+        print(f"{'段階':<14} {'秒':>8} {'入力':>9} {'出力':>9} {'キャッシュ':>10}")
+        for r in self.stages:
+            cells = ["-" if r[k] is None else str(r[k]) for k in ("rows_in", "rows_out", "cache_hits")]
+            mark = " (エラー)" if r.get("error") else ""
+            print(f"{r['stage']:<14} {r['seconds']:>8.2f} {cells[0]:>9} {cells[1]:>9} {cells[2]:>10}{mark}")
+        print(f"{'合計':<14} {self.total_seconds:>8.2f}")
+
+    def write_json(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        report = dict(extra, total_seconds=self.total_seconds, stages=self.stages)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,82 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+# --- 設定: 正規化パターン (事前コンパイル) ---
+_RE_EXTENSION = re.compile(r'\.[a-zA-Z0-9]{3,4}$')
+_RE_BRACKETS = re.compile(r'[\[\(\{【].*?[\]\)\}】]')
+# キー変更表記 (+2, KEY-1, 原キー, キー変更：) は1回の走査でまとめて消す
+# どれも空白に置き換えるだけなので、順に re.sub した場合と結果は変わらない
+_RE_KEY_MARKS = re.compile(r'(?:key|KEY)?\s*[\+\-]\s*[0-9]+|原キー|(?:キー)?変更[:：]?')
+# 区切り記号は正規表現ではなく変換表で空白にする
+_SEPARATOR_TABLE = str.maketrans({c: ' ' for c in '~〜～-_=,.'})
+
+# 同じ文字列 (曲名・作品名・集計表の項目) は何度も出てくるので結果を覚えておく
+CACHE_SIZE = 1 << 16
+
+
+def _normalize(text, strip_brackets):
+    # ASCIIだけの文字列は NFKC で変化しない
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    text = _RE_EXTENSION.sub('', text)
+    if strip_brackets:
+        text = _RE_BRACKETS.sub(' ', text)
+    text = _RE_KEY_MARKS.sub(' ', text)
+    text = text.translate(_SEPARATOR_TABLE)
+    # str.split() の空白判定は正規表現の \s と同じ
+    return ' '.join(text.split()).upper()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_cached(text):
+    return _normalize(text, True)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_offline_cached(text):
+    return _normalize(text, False)
+
+
+# --- 関数: テキスト正規化 (検索キー用・履歴データ用) ---
+def normalize_text(text):
+    if not isinstance(text, str):
+        return str(text)
+    return _normalize_cached(text)
+
+
+# --- 関数: オフラインリスト用正規化 (カッコの中身を残す) ---
+def normalize_offline_text(text):
+    if not isinstance(text, str):
+        return str(text)
+    return _normalize_offline_cached(text)
+
+
+# --- 関数: 検索用の畳み込み (normalize_text と同じ NFKC・大文字化のみ、記号やキー表記は残す) ---
+def fold_search_text(text):
+    if not isinstance(text, str):
+        text = str(text)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return text.upper()
+
+
+# --- 関数: 列・リストをまとめて正規化 ---
+# 重複する値は1回だけ正規化する
+def normalize_series(series, offline=False):
+    func = normalize_offline_text if offline else normalize_text
+    mapping = {value: func(value) for value in pd.unique(series)}
+    return series.map(mapping)
+
+
+def normalize_many(values, offline=False):
+    func = normalize_offline_text if offline else normalize_text
+    return [func(value) for value in values]
+
+
+def clear_cache():
+    _normalize_cached.cache_clear()
+    _normalize_offline_cached.cache_clear()
+
@@ -1,233 +1,94 @@
-
-import pandas as pd
-import requests
+import argparse
+import cProfile
 import datetime
+import json
 import os
+import pstats
 import re
-import unicodedata
-import json
+import time
+import traceback
 from itertools import groupby
 
-# --- 時刻設定 ---
-now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
-current_date_str = now.strftime("%Y/%m/%d")
-current_datetime_str = now.strftime("%Y/%m/%d %H:%M")
-
-# --- 設定: ポート番号と部屋主の名前の対応表 ---
-room_map = {
-    11000: "ゆーふうりん部屋",
-    11001: "ゆーふうりん部屋",
-    11002: "ゆーふうりん部屋",
-    11003: "ゆーふうりん部屋",
-    11004: "ゆーふうりん部屋",
-    11005: "ゆーふうりん部屋",
-    11006: "ゆーふうりん部屋",
-    11007: "ゆーふうりん部屋",
-    11008: "ゆーふうりん部屋",
-    11009: "ゆーふうりん部屋",
-    11012: "加古部屋",
-    11021: "成田部屋",
-    11022: "成田部屋",
-    11028: "タマ部屋",
-    11058: "すみた部屋",
-    11059: "つぼはち部屋",
-    11063: "なぎ部屋",
-    11064: "naoo部屋",
-    11066: "芝ちゃん部屋",
-    11067: "crom部屋",
-    11068: "けんしん部屋",
-    11069: "けんちぃ部屋",
-    11070: "黒河部屋",
-    11071: "黒河部屋",
-    11074: "tukinowa部屋",
-    11077: "v3部屋",
-    11078: "のんでるん部屋",
-    11079: "まどか部屋",
-    11084: "タカヒロ部屋",
-    11085: "タカヒロ部屋",
-    11086: "タカヒロ部屋",
-    11087: "MiO部屋",
-    11088: "ほっしー部屋",
-    11091: "千秋部屋",
-    11092: "ヒロ部屋",
-    11101: "えみち部屋",
-    11102: "るえ部屋",
-    11103: "ながし部屋",
-    11104: "MrN部屋",
-    11105: "ヤマテル部屋",
-    11106: "冨塚部屋",
-    11107: "ブルーベリー部屋",
-    11108: "コタ部屋",
-    11109: "姫部屋"
-}
-
-# --- 関数: テキスト正規化 (検索キー用・履歴データ用) ---
-def normalize_text(text):
-    if not isinstance(text, str):
-        return str(text)
-    
-    text = unicodedata.normalize('NFKC', text)
-    text = re.sub(r'\.[a-zA-Z0-9]{3,4}$', '', text)
-    text = re.sub(r'[\[\(\{【].*?[\]\)\}】]', ' ', text)
-    text = re.sub(r'(key|KEY)?\s*[\+\-]\s*[0-9]+', ' ', text)
-    text = re.sub(r'原キー', ' ', text)
-    text = re.sub(r'(キー)?変更[:：]?', ' ', text)
-    text = re.sub(r'[~〜～\-_=,.]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text.upper()
-
-# --- 関数: オフラインリスト用正規化 ---
-def normalize_offline_text(text):
-    if not isinstance(text, str):
-        return str(text)
-    
-    text = unicodedata.normalize('NFKC', text)
-    text = re.sub(r'\.[a-zA-Z0-9]{3,4}$', '', text)
-    text = re.sub(r'(key|KEY)?\s*[\+\-]\s*[0-9]+', ' ', text)
-    text = re.sub(r'原キー', ' ', text)
-    text = re.sub(r'(キー)?変更[:：]?', ' ', text)
-    text = re.sub(r'[~〜～\-_=,.]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text.upper()
-
-# --- 関数: マッチング判定 (グラフ用に追加) ---
-def check_match(target_text, source_series):
-    if not target_text:
-        return pd.Series([False] * len(source_series))
-    safe_target = re.escape(target_text)
-    if re.match(r'^[A-Z0-9\s]+$', target_text):
-        pattern = r'(?:^|[^A-Z0-9])' + safe_target + r'(?:[^A-Z0-9]|$)'
-        return source_series.str.contains(pattern, regex=True, case=False, na=False)
-    else:
-        return source_series.str.contains(safe_target, case=False, na=False)
-
+import pandas as pd
 
-# --- 1. 過去データ読み込み ---
+from build_manifest import (
+    fingerprint, source_digest, load_build_manifest, save_build_manifest, is_fresh, output_digests,
+    load_analysis_cache, save_analysis_cache,
+)
+from cool_items import load_cool_items
+from daily_rollup import load_rollup, update_rollup
+from history_frame import load_history_frame
+from history_store import (
+    open_history_db, sync_history_db, insert_history_rows, load_history, export_history_csv, history_generation,
+    last_room_dates, to_date_key, HISTORY_DB_FILE, HISTORY_DATE_COLUMN,
+)
+from html_writer import HtmlWriter
+from loaded_inputs import LoadedInputs
+from room_fetcher import fetch_rooms, load_fetch_cache, save_fetch_cache, file_digest
+from room_registry import load_room_registry, due_ports, record_polls, prune_schedule, RUN_INTERVAL
+from ngram_index import NgramIndex
+from offline_list import (
+    OFFLINE_FILE_PATTERN, discover_offline_files, load_offline_cache, save_offline_cache, offline_digests,
+    load_offline_targets,
+)
+from ranking_engine import cumulative_rank_series
+from season_archive import ARCHIVE_COLUMNS, load_season_archives, season_start
+from setlist_data import render_setlist_headers, write_setlist_shards
+from stage_timer import StageRecorder
+from text_normalizer import normalize_series
+
+
+# --- 設定: 入出力ファイル ---
+# 取得する部屋 (ポート番号・部屋主の名前・取得間隔の上限)
+room_registry_file = "rooms.csv"
 history_file = "history.csv"
-if os.path.exists(history_file):
-    try:
-        history_df = pd.read_csv(history_file, encoding='utf-8-sig')
-        history_df = history_df.fillna("")
-    except Exception as e:
-        print(f"履歴ファイルの読み込みエラー: {e}")
-        history_df = pd.DataFrame()
-else:
-    history_df = pd.DataFrame()
-
-# --- 2. 新しいデータ取得 ---
-target_ports = list(room_map.keys())
-new_data_frames = []
-
-print("データを取得中...")
-for port in target_ports:
-    url = f"http://Ykr.moe:{port}/simplelist.php"
-    try:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
-        
-        dfs = pd.read_html(response.content)
-        if dfs:
-            df = dfs[0]
-            df = df.fillna("") 
-            df['部屋主'] = room_map[port]
-            df['取得日'] = current_date_str
-            new_data_frames.append(df)
-            
-    except Exception as e:
-        pass 
-
-if new_data_frames:
-    new_df = pd.concat(new_data_frames, ignore_index=True)
-    combined_df = pd.concat([history_df, new_df], ignore_index=True)
-
-    clean_check_cols = ['部屋主', '曲名（ファイル名）', '作品名', '歌手名']
-    for col in clean_check_cols:
-        if col in combined_df.columns:
-            combined_df = combined_df[combined_df[col] != col]
-
-    subset_cols = ['部屋主', '順番', '曲名（ファイル名）', '歌った人']
-    existing_cols = [c for c in subset_cols if c in combined_df.columns]
-    final_df = combined_df.drop_duplicates(subset=existing_cols, keep='first')
-    final_df = final_df.fillna("")
-
-    if '順番' in final_df.columns:
-        final_df['順番'] = pd.to_numeric(final_df['順番'], errors='coerce')
-        
-    final_df['temp_date'] = pd.to_datetime(final_df['取得日'], errors='coerce')
-    final_df = final_df.sort_values(by=['temp_date', '順番'], ascending=[False, False])
-    final_df = final_df.drop(columns=['temp_date'])
-    
-    cols = list(final_df.columns)
-    if '部屋主' in cols:
-        cols.insert(0, cols.pop(cols.index('部屋主')))
-        final_df = final_df[cols]
-
-    final_df.to_csv(history_file, index=False, encoding='utf-8-sig')
-    print("履歴ファイルを更新しました。")
-else:
-    final_df = history_df
-    print("新しいデータなし。過去データを使用。")
-
-
-# ==========================================
-# ★集計処理
-# ==========================================
-analysis_html_content = "" 
-ranking_count_html_content = "" # 変更: 歌唱数ランキング用
-ranking_user_html_content = ""  # 変更: 歌唱人数ランキング用
-
-cool_data_exists = False
-ranking_data_list = [] 
-
-# ★追加: グラフ用データ
-graph_series_data_count = {}
-graph_series_data_user = {}
-
-created_lists_html = ""
-uncreated_lists_html = ""
-
-cool_file = "cool_analysis.csv" 
-
-# --- オフラインリスト読み込み ---
-offline_files = [
-    "offline_list_2026_1st.csv",
-    "offline_list_2025_1st.csv",
-    "offline_list_2025_2nd.csv"
+output_file = "index.html"
+# セットリストのデータ (取得月ごとのJSON) の出力先。index.html からの相対パスで読み込む
+setlist_dir = "setlist"
+cool_file = "cool_analysis.csv"
+# オフラインリスト (このパターンに合うファイルを全て読み込む)
+offline_file_pattern = OFFLINE_FILE_PATTERN
+# --profile の出力先
+PROFILE_DIR = os.path.join(".cache", "profile")
+# --daemon の取得の周期 (秒)
+DAEMON_INTERVAL = 60
+# 出力に関わる処理のソース (変わったら入力が同じでも作り直す)
+GENERATOR_SOURCES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ["update_list.py", "setlist_data.py", "html_writer.py", "history_store.py", "text_normalizer.py",
+                 "ngram_index.py", "pattern_matcher.py", "ranking_engine.py", "season_archive.py",
+                 "daily_rollup.py", "offline_list.py", "cool_items.py", "history_frame.py"]
 ]
-offline_targets = []
 
-for file_path in offline_files:
-    if os.path.exists(file_path):
-        try:
-            offline_df = pd.read_csv(file_path)
-            offline_df = offline_df.fillna("")
-            
-            if '曲名' in offline_df.columns:
-                targets = [normalize_offline_text(str(x)) for x in offline_df['曲名'].tolist()]
-                offline_targets.extend(targets)
-                print(f"オフラインリスト({file_path})を読み込みました。追加件数: {len(targets)}")
-            else:
-                print(f"オフラインリスト({file_path})に'曲名'カラムが見つかりません。")
-                
-        except Exception as e:
-            print(f"オフラインリスト({file_path})読み込みエラー: {e}")
-    else:
-        print(f"オフラインリスト({file_path})が見つかりません。")
-
-print(f"オフラインリスト合計件数: {len(offline_targets)}")
-
-
-# --- ★関数: カテゴリ別リストHTML生成 ---
+# --- 設定: クール集計 ---
+ALLOWED_CATEGORIES = ["2026年冬アニメ", "2025年秋アニメ"]
+# 推移グラフの対象
+GRAPH_TARGET_CATEGORY = "2026年冬アニメ"
+# 集計表示用の期間 (2026/01/01 - 2026/03/31)
+TARGET_START_DATE = "2026/01/01"
+TARGET_END_DATE = "2026/03/31"
+# 歌った人にこれらを含む行は集計しない
+EXCLUDE_KEYWORDS = ['test', 'テスト', 'システム', 'admin', 'System']
+# 除外キーワードのどれかを含むか (1つの正規表現にまとめる)
+_RE_EXCLUDE = re.compile("|".join(re.escape(k) for k in EXCLUDE_KEYWORDS) or r"(?!)")
+# 作品名が空の行は、曲名の【】の中身を作品名として使う
+_RE_WORKNAME_IN_SONG = re.compile(r'【(.*?)】')
+EMPTY_WORKNAMES = ["-", "−", "", "nan"]
+# ランキング表の表示件数
+RANKING_LIMIT = 20
+# セットリスト表に出さない列
+columns_to_hide = ['コメント']
+
+
+# --- ★関数: カテゴリ別リストHTML生成 (断片を順に返す) ---
 def generate_category_html_block(category_name, item_list):
     if not item_list:
-        return ""
+        return
     
     # アニメ名でソート
     item_list.sort(key=lambda x: x['anime'])
     
-    html = f"""
+    yield f"""
     <div class="category-block">
         <div class="category-header" onclick="toggleCategory(this)">
             {category_name} <i class="fas fa-chevron-down" style="float:right;"></i>
@@ -250,233 +111,300 @@ def generate_category_html_block(category_name, item_list):
         group_items = list(group_iter)
         rowspan = len(group_items)
         
-        html += '<tbody class="anime-group">'
+        yield '<tbody class="anime-group">'
         
         for i, item in enumerate(group_items):
             clean_anime = re.sub(r'[（\(].*?[）\)]', '', item['anime']).strip()
             search_word = f"{clean_anime} {item['song']}"
             link_tag_start = f'<a href="#host/search.php?searchword={search_word}" class="export-link">'
             
-            html += '<tr>'
+            yield '<tr>'
             if i == 0:
-                html += f'<td rowspan="{rowspan}">{item["anime"]}</td>'
+                yield f'<td rowspan="{rowspan}">{item["anime"]}</td>'
             
-            html += f'<td align="center">{link_tag_start}{item["type"]}</a></td>'
-            html += f'<td>{link_tag_start}{item["artist"]}</a></td>'
-            html += f'<td>{link_tag_start}{item["song"]}</a></td>'
-            html += '</tr>'
+            yield f'<td align="center">{link_tag_start}{item["type"]}</a></td>'
+            yield f'<td>{link_tag_start}{item["artist"]}</a></td>'
+            yield f'<td>{link_tag_start}{item["song"]}</a></td>'
+            yield '</tr>'
         
-        html += '</tbody>'
+        yield '</tbody>'
     
-    html += "</table></div></div>"
-    return html
+    yield "</table></div></div>"
 
 
-if not os.path.exists(cool_file):
-    possible_files = [f for f in os.listdir('.') if f.endswith('.csv') and 'history' not in f and 'offline' not in f]
-    if possible_files:
-        cool_file = possible_files[0]
+# ==========================================
+# ★処理段階
+# 各段階は引数で受け取ったものだけを使い、結果を戻り値で返す
+# ==========================================
 
-if cool_file and os.path.exists(cool_file):
-    try:
-        raw_df = None
-        for enc in ['utf-8-sig', 'cp932', 'shift_jis']:
-            try:
-                raw_df = pd.read_csv(cool_file, header=None, encoding=enc)
-                print(f"集計表({cool_file})をエンコーディング {enc} で読み込みました。")
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if raw_df is not None:
-            raw_df = raw_df.fillna("")
-            
-            print("CSV内の重複行を削除中...")
-            raw_df = raw_df.drop_duplicates(keep='last')
-            
-            # --- グラフ用と集計用のデータ準備 ---
-            analysis_source_df = final_df.copy()
-            analysis_source_df['dt_obj'] = pd.to_datetime(analysis_source_df['取得日'], errors='coerce')
-            # 日付なしは除外
-            analysis_source_df = analysis_source_df.dropna(subset=['dt_obj'])
-            
-            analysis_source_df['norm_filename'] = analysis_source_df['曲名（ファイル名）'].apply(normalize_text)
-            
-            def get_rescued_workname(row):
-                raw_work = str(row['作品名']) if pd.notna(row['作品名']) else ""
-                raw_song = str(row['曲名（ファイル名）']) if pd.notna(row['曲名（ファイル名）']) else ""
-                if raw_work.strip() in ["-", "−", "", "nan"]:
-                    match = re.search(r'【(.*?)】', raw_song)
-                    if match:
-                        return normalize_text(match.group(1))
-                return normalize_text(raw_work)
-
-            if '作品名' in analysis_source_df.columns:
-                analysis_source_df['norm_workname'] = analysis_source_df.apply(get_rescued_workname, axis=1)
-            else:
-                analysis_source_df['norm_workname'] = ""
-
-            exclude_keywords = ['test', 'テスト', 'システム', 'admin', 'System']
-            
-            # 全期間の履歴（グラフ用）
-            full_history = analysis_source_df[
-                (~analysis_source_df['歌った人'].astype(str).apply(lambda x: any(k in x for k in exclude_keywords)))
-            ].sort_values('dt_obj')
-            
-            # 集計表示用の期間 (2026/01/01 - 2026/03/31)
-            start_date = pd.to_datetime("2026/01/01")
-            end_date = pd.to_datetime("2026/03/31")
-            target_history = full_history[
-                (full_history['dt_obj'] >= start_date) & 
-                (full_history['dt_obj'] <= end_date)
-            ]
-
-            categorized_data = {}
-            ALLOWED_CATEGORIES = ["2026年冬アニメ", "2025年秋アニメ"]
-            current_category = None
-            
-            for idx, row in raw_df.iterrows():
-                if not any(str(x).strip() for x in row): continue
-                col0 = str(row[0]).strip()
-
-                is_category_line = any(cat in col0 for cat in ALLOWED_CATEGORIES) and "作品名" not in col0
-
-                if is_category_line:
-                    current_category = col0
-                    if current_category not in categorized_data:
-                        categorized_data[current_category] = []
-                    continue
-                
-                if "作品名" in col0: continue
-                if current_category is None: continue
-
-                anime = str(row[0]).strip() if len(row) > 0 else ""
-                type_ = str(row[1]).strip() if len(row) > 1 else ""
-                artist = str(row[2]).strip() if len(row) > 2 else ""
-                song = str(row[3]).strip() if len(row) > 3 else ""
-                
-                if not anime and not song: continue
-
-                categorized_data[current_category].append({
-                    "anime": anime, "type": type_, "artist": artist, "song": song
-                })
-
-            # ==========================================
-            # ★ グラフデータ計算 (全期間日次ランキング)
-            # ==========================================
-            print("グラフデータ計算中...")
-            graph_target_cat = "2026年冬アニメ"
-            
-            if graph_target_cat in categorized_data:
-                winter_items = categorized_data[graph_target_cat]
-                
-                # アイテムの正規化情報を事前作成
-                items_with_norm = []
-                for item in winter_items:
-                    items_with_norm.append({
-                        "meta": item,
-                        "song_norm": normalize_text(item["song"]),
-                        "anime_norm": normalize_text(item["anime"]),
-                        "name": f"{item['anime']} {item['song']}"
-                    })
-
-                # 全履歴に対するマッチング情報を事前計算
-                matched_records = []
-                for idx, item in enumerate(items_with_norm):
-                    song_pat = item["song_norm"]
-                    anime_pat = item["anime_norm"]
-                    if not song_pat and not anime_pat: continue
-                    
-                    song_match = check_match(song_pat, full_history['norm_filename'])
-                    mask = None
-                    if song_pat and anime_pat:
-                        anime_match = (
-                            full_history['norm_filename'].str.contains(re.escape(anime_pat), case=False, na=False) |
-                            full_history['norm_workname'].str.contains(re.escape(anime_pat), case=False, na=False)
-                        )
-                        mask = song_match & anime_match
-                    elif song_pat:
-                        mask = song_match
-                    elif anime_pat:
-                        mask = (
-                            full_history['norm_filename'].str.contains(re.escape(anime_pat), case=False, na=False) |
-                            full_history['norm_workname'].str.contains(re.escape(anime_pat), case=False, na=False)
-                        )
-                    
-                    if mask is not None:
-                        for _, row in full_history[mask].iterrows():
-                            matched_records.append({
-                                "date": row['dt_obj'],
-                                "item_idx": idx,
-                                "user": row['歌った人']
-                            })
-                
-                # 日付順にソート
-                matched_records.sort(key=lambda x: x['date'])
-                
-                if matched_records:
-                    unique_dates = sorted(list(set(r['date'] for r in matched_records)))
-                    current_counts = {} # item_idx -> count
-                    current_users = {}  # item_idx -> set(users)
-                    rec_ptr = 0
-                    total_recs = len(matched_records)
-                    
-                    for current_dt in unique_dates:
-                        dt_str = current_dt.strftime("%Y-%m-%d")
-                        
-                        # その日までのデータを累積
-                        while rec_ptr < total_recs and matched_records[rec_ptr]['date'] <= current_dt:
-                            rec = matched_records[rec_ptr]
-                            idx = rec['item_idx']
-                            user = rec['user']
-                            
-                            current_counts[idx] = current_counts.get(idx, 0) + 1
-                            if idx not in current_users:
-                                current_users[idx] = set()
-                            current_users[idx].add(user)
-                            rec_ptr += 1
-                        
-                        # --- 歌唱数ランキング ---
-                        ranking_src_count = []
-                        for idx, cnt in current_counts.items():
-                            ranking_src_count.append({"name": items_with_norm[idx]["name"], "val": cnt})
-                        ranking_src_count.sort(key=lambda x: x['val'], reverse=True)
-                        
-                        rank = 1
-                        prev_val = -1
-                        for i, d in enumerate(ranking_src_count):
-                            if i > 0 and d['val'] < prev_val: rank = i + 1
-                            prev_val = d['val']
-                            if rank <= 20:
-                                if d['name'] not in graph_series_data_count: graph_series_data_count[d['name']] = []
-                                graph_series_data_count[d['name']].append({"x": dt_str, "y": rank})
-
-                        # --- 人数ランキング ---
-                        ranking_src_user = []
-                        for idx, u_set in current_users.items():
-                            if len(u_set) > 0:
-                                ranking_src_user.append({"name": items_with_norm[idx]["name"], "val": len(u_set)})
-                        ranking_src_user.sort(key=lambda x: x['val'], reverse=True)
-                        
-                        rank = 1
-                        prev_val = -1
-                        for i, d in enumerate(ranking_src_user):
-                            if i > 0 and d['val'] < prev_val: rank = i + 1
-                            prev_val = d['val']
-                            if rank <= 20:
-                                if d['name'] not in graph_series_data_user: graph_series_data_user[d['name']] = []
-                                graph_series_data_user[d['name']].append({"x": dt_str, "y": rank})
-
-            print("グラフデータ計算完了。")
-
-            # --- クール集計HTML生成 & リスト生成 ---
-            for category, items in categorized_data.items():
-                
-                cat_created_items = []
-                cat_uncreated_items = []
-
-                # メイン集計用HTMLヘッダー (人数カラムを追加)
-                analysis_html_content += f"""
+# --- 段階1: 過去データ読み込み ---
+# 履歴は索引付きのDBで持ち、history.csv はそこから書き出す
+# history_db を渡すと開いてあるDBを使う (常駐モード)
+# 戻り値: (履歴DB, history.csv から作り直したか)
+def load_history_stage(history_file, history_db=None):
+    if history_db is None:
+        history_db = open_history_db()
+    rebuilt = sync_history_db(history_db, history_file)
+    return history_db, rebuilt
+
+
+# --- 段階2: 新しいデータ取得 ---
+# 全ポートを並列取得 (1部屋の応答待ちで全体が遅れないようにする)
+# 新しい行が出ていない部屋は取得間隔を空け (部屋ごとの上限まで)、force=True なら全部屋を取得する
+# 前回から内容が変わっていない部屋は解析・マージを行わない
+# run_interval: 実行間隔 (取得間隔を空けるときの単位)
+# 戻り値: (部屋ごとの新しい行のDataFrameのリスト, 取得キャッシュ, 取得結果の件数)
+def fetch_stage(rooms, now, history_db, history_file, force=False, run_interval=RUN_INTERVAL):
+    print("データを取得中...")
+    fetch_cache = load_fetch_cache(history_file)
+    schedule = fetch_cache.setdefault("schedule", {})
+    prune_schedule(schedule, rooms)
+    ports = list(rooms) if force else due_ports(rooms, schedule, now, last_room_dates(history_db), run_interval)
+    if len(ports) < len(rooms):
+        print(f"取得間隔を空ける部屋: {len(rooms) - len(ports)} ポート")
+
+    fetch_stats = {}
+    new_data_frames = fetch_rooms({port: rooms[port]["owner"] for port in ports}, now.strftime("%Y/%m/%d"),
+                                  cache=fetch_cache, stats=fetch_stats)
+    record_polls(schedule, now, fetch_stats["new_rows"], run_interval)
+    fetch_stats["skipped"] = len(rooms) - len(ports)
+    return new_data_frames, fetch_cache, fetch_stats
+
+
+# --- 段階3: 新しい行だけを履歴に追加 ---
+# 各部屋の既読位置より後の行だけが届き、重複の判定はDBのキー索引で行う
+# (順番がリセットされた部屋の行は、過去の行と同じ内容でも新しい行として残す)
+# 戻り値: 追加した行数
+def merge_stage(history_db, new_data_frames, history_file, fetch_cache):
+    new_df = pd.concat(new_data_frames, ignore_index=True) if new_data_frames else pd.DataFrame()
+    added_count = insert_history_rows(history_db, new_df)
+
+    if added_count > 0:
+        export_history_csv(history_db, history_file)
+        print(f"履歴ファイルを更新しました。(追加 {added_count} 件)")
+    else:
+        print("新しいデータなし。過去データを使用。")
+
+    # 履歴の保存が済んでからキャッシュを記録する (途中で落ちた場合は次回取り直す)
+    save_fetch_cache(fetch_cache, history_file)
+    return added_count
+
+
+# --- 段階4: オフラインリスト読み込み ---
+# 正規化済みの曲名はファイルごとに保存しておき、変わっていないファイルは読み込まない
+# offline_cache: offline_list.load_offline_cache の内容 (最新の状態に更新して保存する)
+# 戻り値: (正規化済みの曲名のリスト, 作成数の集計用の部分一致の索引)
+def load_offline_stage(offline_files, offline_cache):
+    targets_by_file = load_offline_targets(offline_files, offline_cache)
+    save_offline_cache(offline_cache)
+    offline_targets = [target for path in offline_files for target in targets_by_file.get(path, [])]
+
+    print(f"オフラインリスト合計件数: {len(offline_targets)}")
+    # 大文字小文字は区別する
+    offline_index = NgramIndex(offline_targets)
+    return offline_targets, offline_index
+
+
+# --- 段階5: 集計表 (cool_analysis.csv) の読み込み ---
+# 戻り値: {カテゴリ名: [{"anime", "type", "artist", "song", "anime_norm", "song_norm", "song_raw_norm"}, ...]}
+#         (集計表の順、*_norm は照合用に正規化したもの)
+#         集計表が無い・読めない場合は None
+def parse_cool_stage(cool_file):
+    if not os.path.exists(cool_file):
+        possible_files = [f for f in os.listdir('.') if f.endswith('.csv') and 'history' not in f and 'offline' not in f
+                          and f != room_registry_file]
+        if possible_files:
+            cool_file = possible_files[0]
+
+    if not (cool_file and os.path.exists(cool_file)):
+        return None
+
+    return load_cool_items(cool_file, ALLOWED_CATEGORIES)
+
+
+# --- 段階6: 集計用の履歴の準備 (曲名・作品名の正規化) ---
+# archived_rows (終わったクールの履歴アーカイブ、正規化済み・同じ内容の行をまとめたもの) があれば後ろに続ける
+# 戻り値: 集計用の行 (日付順、weight 列 = まとめた行数)
+def normalize_stage(history_df, archived_rows=None):
+    rows = prepare_analysis_rows(history_df)
+    rows['weight'] = 1
+    if archived_rows is not None:
+        rows = pd.concat([archived_rows, rows], ignore_index=True)
+    return rows.sort_values('dt_obj', kind='stable')
+
+
+# --- 段階7: 日ごとの集計の更新 ---
+# 前回から取り込まれた行だけを正規化・照合して、(日, 集計項目, 歌った人) ごとの歌唱数に足し込む
+# 集計項目・処理・履歴DBの世代が変わった場合 (と force=True の場合) は、
+# 終わったクールのアーカイブと今のクールの履歴から作り直す
+# 戻り値: daily_rollup.update_rollup の結果
+def rollup_stage(history_db, now, item_keys, generator_digest, force=False):
+    rollup_key = fingerprint("rollup", generator_digest, item_keys, history_generation(history_db))
+
+    def load_all_rows():
+        hot_start = season_start(now.date())
+        archived_rows, _ = load_season_archives(history_db, hot_start, generator_digest, prepare_analysis_rows)
+        return normalize_stage(load_history(history_db, start_date=hot_start.isoformat()), archived_rows)
+
+    def load_new_rows(after_seq):
+        return normalize_stage(load_history(history_db, after_seq=after_seq))
+
+    return update_rollup(history_db, rollup_key, item_keys, load_all_rows, load_new_rows, rebuild=force)
+
+
+# --- 関数: 集計項目の (曲名, 作品名) (正規化済み、重複なし・両方空のものは除く) ---
+def cool_item_keys(categorized_data):
+    keys = {(item["song_norm"], item["anime_norm"]) for items in categorized_data.values() for item in items}
+    return sorted(key for key in keys if any(key))
+
+
+# --- 関数: 履歴から集計用の行を作る (日付なし・除外対象の行は除く) ---
+# 除外の判定・正規化は列単位で行い、同じ値は1回だけ計算する
+# 戻り値: dt_obj・norm_filename・norm_workname・歌った人 の列の DataFrame
+def prepare_analysis_rows(history_df):
+    # 日付なしは除外 (dt_obj は履歴の読み込み時に作った取得日の日付型の列)
+    analysis_source_df = history_df.dropna(subset=[HISTORY_DATE_COLUMN])
+
+    singers = analysis_source_df['歌った人'].astype(str)
+    excluded = {singer: _RE_EXCLUDE.search(singer) is not None for singer in pd.unique(singers)}
+    analysis_source_df = analysis_source_df[~singers.map(excluded).astype(bool)].copy()
+
+    songs = analysis_source_df['曲名（ファイル名）']
+    analysis_source_df['norm_filename'] = normalize_series(songs)
+
+    if '作品名' in analysis_source_df.columns:
+        # 作品名が空・"-" の行は、曲名の【】の中身があればそれを作品名とする
+        works = analysis_source_df['作品名'].astype(str)
+        rescued = songs.astype(str).str.extract(_RE_WORKNAME_IN_SONG, expand=False)
+        use_rescued = works.str.strip().isin(EMPTY_WORKNAMES) & rescued.notna()
+        analysis_source_df['norm_workname'] = normalize_series(works.where(~use_rescued, rescued))
+    else:
+        analysis_source_df['norm_workname'] = ""
+
+    return analysis_source_df[['dt_obj'] + ARCHIVE_COLUMNS]
+
+
+# --- 段階8: 日ごとの集計とオフラインリストの照合 ---
+# rollup: daily_rollup.load_rollup の結果 (日, 項目の曲名・作品名, 歌った人, 歌唱数)
+# 戻り値: {カテゴリ名: [項目 + "count", "user_count", "creation_count"]}
+#         カテゴリ内の項目は作品名順 (集計表の表示順)
+def match_stage(rollup, categorized_data, offline_index):
+    # 集計期間内の歌唱数・人数 (項目の曲名・作品名ごと)
+    in_target_period = rollup[rollup['day'].between(to_date_key(TARGET_START_DATE), to_date_key(TARGET_END_DATE))]
+    period_totals = in_target_period.groupby(['song', 'anime']).agg(
+        count=('count', 'sum'), user_count=('歌った人', 'nunique'))
+    totals = {key: (int(c), int(u)) for key, c, u in
+              zip(period_totals.index, period_totals['count'], period_totals['user_count'])}
+
+    cool_tables = {}
+    for category, items in categorized_data.items():
+        entries = []
+        for item in sorted(items, key=lambda x: x['anime']):
+            target_song_norm = item["song_norm"]
+            target_anime_norm = item["anime_norm"]
+
+            # --- 歌唱数・人数（ユニーク）集計 (集計期間内の行のみ) ---
+            count, user_count = totals.get((target_song_norm, target_anime_norm), (0, 0))
+
+            # --- 作成数集計 ---
+            creation_count = 0
+
+            # ★追加: カッコの中身を温存した検索用文字列 (集計表の読み込み時に作成済み)
+            # (normalize_offline_textはカッコを消さない関数です)
+            target_song_raw_norm = item["song_raw_norm"]
+
+            if target_song_norm:
+                # ★変更: 「カッコ削除版」または「カッコ温存版」のどちらかが含まれていればOKにする
+                offline_match = offline_index.contains(target_song_norm) | offline_index.contains(target_song_raw_norm)
+                if target_anime_norm:
+                    offline_match = offline_match & offline_index.contains(target_anime_norm)
+                creation_count = int(offline_match.sum())
+
+            entries.append(dict(item, count=count, user_count=user_count, creation_count=creation_count))
+        cool_tables[category] = entries
+    return cool_tables
+
+
+# --- 段階9: 順位計算 (推移グラフ・ランキング表) ---
+# 戻り値: (歌唱数の推移, 人数の推移, {"count"/"user": {カテゴリ名: [(順位, 項目), ...]}})
+def rank_stage(rollup, categorized_data, cool_tables):
+    # ==========================================
+    # ★ グラフデータ計算 (全期間日次ランキング)
+    # ==========================================
+    print("グラフデータ計算中...")
+    graph_series_data_count = {}
+    graph_series_data_user = {}
+
+    if GRAPH_TARGET_CATEGORY in categorized_data:
+        winter_items = categorized_data[GRAPH_TARGET_CATEGORY]
+
+        # アイテムの正規化情報を事前作成
+        items_with_norm = []
+        for item in winter_items:
+            items_with_norm.append({
+                "meta": item,
+                "song_norm": item["song_norm"],
+                "anime_norm": item["anime_norm"],
+                "name": f"{item['anime']} {item['song']}"
+            })
+
+        # 日ごとの集計から、各項目の行 (日・歌った人ごとの歌唱数) を集める
+        rows_by_key = rollup.groupby(['song', 'anime'], sort=False).indices
+        matched_rows = []
+        matched_items = []
+        for idx, item in enumerate(items_with_norm):
+            song_pat = item["song_norm"]
+            anime_pat = item["anime_norm"]
+            if not song_pat and not anime_pat: continue
+
+            rows = rows_by_key.get((song_pat, anime_pat), [])
+            matched_rows.extend(rows)
+            matched_items.extend([idx] * len(rows))
+
+        # 日 × 項目の累積歌唱数・累積人数から、日ごとの順位の推移を作る
+        graph_series_data_count, graph_series_data_user = cumulative_rank_series(
+            rollup['day'].iloc[matched_rows],
+            matched_items,
+            rollup['歌った人'].iloc[matched_rows],
+            [item["name"] for item in items_with_norm],
+            weights=rollup['count'].iloc[matched_rows],
+        )
+
+    print("グラフデータ計算完了。")
+
+    # ==========================================
+    # ★ランキング (歌唱数 & 歌唱人数 の2パターン)
+    # ==========================================
+    rankings = {"count": {}, "user": {}}
+    for target_cat in ALLOWED_CATEGORIES:
+        if target_cat not in categorized_data:
+            continue
+        cat_items = [d for d in cool_tables[target_cat] if d["count"] > 0]
+
+        for mode, sort_keys in (("count", ("count", "user_count")), ("user", ("user_count", "count"))):
+            # 歌唱数順 (歌唱数 -> 人数) / 人数順 (人数 -> 歌唱数)
+            ordered = sorted(cat_items, key=lambda x: tuple(x[k] for k in sort_keys), reverse=True)
+            val_key = sort_keys[0]
+            ranked = []
+            previous_val = None
+            current_rank = 0
+            for i, item in enumerate(ordered):
+                current_val = item[val_key] # 比較対象の値
+                if current_val != previous_val:
+                    current_rank = i + 1
+                if current_rank > RANKING_LIMIT:
+                    break
+                previous_val = current_val
+                ranked.append((current_rank, item))
+            rankings[mode][target_cat] = ranked
+    return graph_series_data_count, graph_series_data_user, rankings
+
+
+# --- 関数: クール集計表のHTML (断片を順に返す) ---
+def iter_analysis_html(cool_tables):
+    for category, entries in cool_tables.items():
+        # メイン集計用HTMLヘッダー (人数カラムを追加)
+        yield f"""
                 <div class="category-block">
                     <div class="category-header" onclick="toggleCategory(this)">
                         {category} <i class="fas fa-chevron-down" style="float:right;"></i>
@@ -494,145 +422,65 @@ if cool_file and os.path.exists(cool_file):
                             </tr>
                         </thead>
                 """
-                
-                items.sort(key=lambda x: x['anime'])
-                def get_anime_key(x): return x['anime']
-                
-                for anime_name, group_iter in groupby(items, key=get_anime_key):
-                    group_items = list(group_iter)
-                    rowspan = len(group_items)
-                    
-                    analysis_html_content += '<tbody class="anime-group">'
-                    
-                    for i, item in enumerate(group_items):
-                        target_song_norm = normalize_text(item["song"])
-                        target_anime_norm = normalize_text(item["anime"])
-                        
-                        # --- 歌唱数集計 (target_history を使用) ---
-                        song_match_mask = check_match(target_song_norm, target_history['norm_filename'])
-                        anime_match_mask = (
-                            target_history['norm_filename'].str.contains(re.escape(target_anime_norm), case=False, na=False) |
-                            target_history['norm_workname'].str.contains(re.escape(target_anime_norm), case=False, na=False)
-                        )
-                        
-                        if target_song_norm and target_anime_norm:
-                            final_mask = song_match_mask & anime_match_mask
-                        elif target_song_norm:
-                            final_mask = song_match_mask
-                        elif target_anime_norm:
-                            final_mask = anime_match_mask
-                        else:
-                            final_mask = pd.Series([False] * len(target_history))
-
-                        matched_data = target_history[final_mask]
-                        count = len(matched_data)
-                        # ★追加: 人数（ユニーク）カウント
-                        user_count = matched_data['歌った人'].nunique() if count > 0 else 0
-                        
-                        # --- 作成数集計 ---
-                        creation_count = 0
-                        
-                        # ★追加: カッコの中身を温存した検索用文字列を作る
-                        # (normalize_offline_textはカッコを消さない関数です)
-                        target_song_raw_norm = normalize_offline_text(item["song"])
-
-                        if target_song_norm:
-                            for offline_str in offline_targets:
-                                # ★変更: 「カッコ削除版」または「カッコ温存版」のどちらかが含まれていればOKにする
-                                if (target_song_norm in offline_str) or (target_song_raw_norm in offline_str):
-                                    
-                                    if target_anime_norm:
-                                        if target_anime_norm in offline_str:
-                                            creation_count += 1
-                                    else:
-                                        creation_count += 1
-
-                        # --- リストへの振り分け ---
-                        if creation_count >= 1:
-                            cat_created_items.append(item)
-                        else:
-                            cat_uncreated_items.append(item)
-
-                        # ランキング用データ追加
-                        ranking_data_list.append({
-                            "category": category,
-                            "anime": item["anime"],
-                            "song": item["song"],
-                            "artist": item["artist"],
-                            "type": item["type"],
-                            "count": count,
-                            "user_count": user_count # 人数を追加
-                        })
-
-                        # 行スタイル判定 (全て黒字)
-                        row_class = "has-count"
-                        
-                        bar_width = min(count * 20, 150)
-                        bar_html = f'<div class="bar-chart" style="width:{bar_width}px;"></div>' if count > 0 else ""
-                        
-                        # ★追加: ユーザー数グラフ
-                        user_bar_width = min(user_count * 20, 100)
-                        user_bar_html = f'<div class="bar-chart-user" style="width:{user_bar_width}px;"></div>' if user_count > 0 else ""
-
-                        clean_anime = re.sub(r'[（\(].*?[）\)]', '', item['anime']).strip()
-                        search_word = f"{clean_anime} {item['song']}"
-                        
-                        link_tag_start = f'<a href="#host/search.php?searchword={search_word}" class="export-link">'
-                        
-                        analysis_html_content += f'<tr class="{row_class}">'
-                        if i == 0:
-                            analysis_html_content += f'<td rowspan="{rowspan}">{item["anime"]}</td>'
-                        
-                        # 作成数カラム
-                        analysis_html_content += f'<td align="center">{creation_count}</td>'
-
-                        analysis_html_content += f'<td align="center">{link_tag_start}{item["type"]}</a></td>'
-                        analysis_html_content += f'<td>{link_tag_start}{item["artist"]}</a></td>'
-                        analysis_html_content += f'<td>{link_tag_start}{item["song"]}</a></td>'
-                        
-                        # ★追加: 人数カラム (グラフ付き・フォント統一)
-                        analysis_html_content += f'<td class="count-cell"><div class="count-wrapper"><span class="count-num">{user_count}</span>{user_bar_html}</div></td>'
-
-                        analysis_html_content += f'<td class="count-cell"><div class="count-wrapper"><span class="count-num">{count}</span>{bar_html}</div></td>'
-                        analysis_html_content += '</tr>'
-                    
-                    analysis_html_content += '</tbody>'
-                
-                analysis_html_content += "</table></div></div>"
-
-                # --- カテゴリごとのリストHTMLを生成して蓄積 ---
-                created_lists_html += generate_category_html_block(category, cat_created_items)
-                uncreated_lists_html += generate_category_html_block(category, cat_uncreated_items)
-
-            cool_data_exists = True
-            print("クール集計処理完了。")
-            
-            # ==========================================
-            # ★ランキング生成 (歌唱数 & 歌唱人数 の2パターン)
-            # ==========================================
-            print("ランキング生成処理開始...")
-            
-            def generate_ranking_html(mode="count"):
-                html_out = ""
-                for target_cat in ALLOWED_CATEGORIES:
-                    if target_cat not in categorized_data:
-                        continue
-                        
-                    cat_items = [d for d in ranking_data_list if d["category"] == target_cat and d["count"] > 0]
-                    
-                    # ソートロジック
-                    if mode == "count":
-                        # 歌唱数順 (歌唱数 -> 人数)
-                        cat_items.sort(key=lambda x: (x["count"], x["user_count"]), reverse=True)
-                        rank_title = f"{target_cat} 歌唱数ランキング (TOP 20)"
-                        val_key = "count"
-                    else: # user
-                        # 人数順 (人数 -> 歌唱数)
-                        cat_items.sort(key=lambda x: (x["user_count"], x["count"]), reverse=True)
-                        rank_title = f"{target_cat} 歌唱人数ランキング (TOP 20)"
-                        val_key = "user_count"
-
-                    html_out += f"""
+
+        def get_anime_key(x): return x['anime']
+
+        for anime_name, group_iter in groupby(entries, key=get_anime_key):
+            group_items = list(group_iter)
+            rowspan = len(group_items)
+
+            yield '<tbody class="anime-group">'
+
+            for i, item in enumerate(group_items):
+                count = item["count"]
+                user_count = item["user_count"]
+
+                # 行スタイル判定 (全て黒字)
+                row_class = "has-count"
+
+                bar_width = min(count * 20, 150)
+                bar_html = f'<div class="bar-chart" style="width:{bar_width}px;"></div>' if count > 0 else ""
+
+                # ★追加: ユーザー数グラフ
+                user_bar_width = min(user_count * 20, 100)
+                user_bar_html = f'<div class="bar-chart-user" style="width:{user_bar_width}px;"></div>' if user_count > 0 else ""
+
+                clean_anime = re.sub(r'[（\(].*?[）\)]', '', item['anime']).strip()
+                search_word = f"{clean_anime} {item['song']}"
+
+                link_tag_start = f'<a href="#host/search.php?searchword={search_word}" class="export-link">'
+
+                yield f'<tr class="{row_class}">'
+                if i == 0:
+                    yield f'<td rowspan="{rowspan}">{item["anime"]}</td>'
+
+                # 作成数カラム
+                yield f'<td align="center">{item["creation_count"]}</td>'
+
+                yield f'<td align="center">{link_tag_start}{item["type"]}</a></td>'
+                yield f'<td>{link_tag_start}{item["artist"]}</a></td>'
+                yield f'<td>{link_tag_start}{item["song"]}</a></td>'
+
+                # ★追加: 人数カラム (グラフ付き・フォント統一)
+                yield f'<td class="count-cell"><div class="count-wrapper"><span class="count-num">{user_count}</span>{user_bar_html}</div></td>'
+
+                yield f'<td class="count-cell"><div class="count-wrapper"><span class="count-num">{count}</span>{bar_html}</div></td>'
+                yield '</tr>'
+
+            yield '</tbody>'
+
+        yield "</table></div></div>"
+
+
+# --- 関数: ランキング表のHTML (mode: "count" = 歌唱数順 / "user" = 人数順、断片を順に返す) ---
+def iter_ranking_html(rankings, mode="count"):
+    for target_cat, ranked in rankings[mode].items():
+        if mode == "count":
+            rank_title = f"{target_cat} 歌唱数ランキング (TOP 20)"
+        else: # user
+            rank_title = f"{target_cat} 歌唱人数ランキング (TOP 20)"
+
+        yield f"""
                     <div class="category-block">
                         <div class="category-header" onclick="toggleCategory(this)">
                             {rank_title} <i class="fas fa-chevron-down" style="float:right;"></i>
@@ -651,50 +499,37 @@ if cool_file and os.path.exists(cool_file):
                             </thead>
                             <tbody>
                     """
-                    
-                    if not cat_items:
-                        html_out += '<tr><td colspan="6" style="text-align:center; padding:20px;">歌唱データがありません</td></tr>'
-                    else:
-                        previous_val = None
-                        current_rank = 0
-                        
-                        for i, item in enumerate(cat_items):
-                            current_val = item[val_key] # 比較対象の値
-                            
-                            if current_val != previous_val:
-                                current_rank = i + 1
-                            
-                            if current_rank > 20:
-                                break
-                            
-                            previous_val = current_val
-                            
-                            rank_class = f"rank-{current_rank}" if current_rank <= 3 else "rank-normal"
-                            
-                            # ★ランキング行の色付け
-                            row_rank_class = f"rank-row-{current_rank}" if current_rank <= 3 else ""
 
-                            rank_display = f'<span class="rank-badge {rank_class}">{current_rank}</span>'
-                            
-                            if current_rank == 1:
-                                rank_display += ' <i class="fas fa-crown" style="color:#FFD700;"></i>'
-                            elif current_rank == 2:
-                                rank_display += ' <i class="fas fa-medal" style="color:#C0C0C0;"></i>'
-                            elif current_rank == 3:
-                                rank_display += ' <i class="fas fa-medal" style="color:#CD7F32;"></i>'
-                                
-                            bar_width = min(item["count"] * 20, 150)
-                            bar_html = f'<div class="bar-chart" style="width:{bar_width}px;"></div>'
+        if not ranked:
+            yield '<tr><td colspan="6" style="text-align:center; padding:20px;">歌唱データがありません</td></tr>'
+        else:
+            for current_rank, item in ranked:
+                rank_class = f"rank-{current_rank}" if current_rank <= 3 else "rank-normal"
 
-                            # ★人数グラフ
-                            user_bar_width = min(item["user_count"] * 20, 100)
-                            user_bar_html = f'<div class="bar-chart-user" style="width:{user_bar_width}px;"></div>' if item["user_count"] > 0 else ""
+                # ★ランキング行の色付け
+                row_rank_class = f"rank-row-{current_rank}" if current_rank <= 3 else ""
 
-                            clean_anime = re.sub(r'[（\(].*?[）\)]', '', item['anime']).strip()
-                            search_word = f"{clean_anime} {item['song']}"
-                            
-                            # 修正: onclickを削除し、data-hrefのみとする
-                            html_out += f"""
+                rank_display = f'<span class="rank-badge {rank_class}">{current_rank}</span>'
+
+                if current_rank == 1:
+                    rank_display += ' <i class="fas fa-crown" style="color:#FFD700;"></i>'
+                elif current_rank == 2:
+                    rank_display += ' <i class="fas fa-medal" style="color:#C0C0C0;"></i>'
+                elif current_rank == 3:
+                    rank_display += ' <i class="fas fa-medal" style="color:#CD7F32;"></i>'
+
+                bar_width = min(item["count"] * 20, 150)
+                bar_html = f'<div class="bar-chart" style="width:{bar_width}px;"></div>'
+
+                # ★人数グラフ
+                user_bar_width = min(item["user_count"] * 20, 100)
+                user_bar_html = f'<div class="bar-chart-user" style="width:{user_bar_width}px;"></div>' if item["user_count"] > 0 else ""
+
+                clean_anime = re.sub(r'[（\(].*?[）\)]', '', item['anime']).strip()
+                search_word = f"{clean_anime} {item['song']}"
+
+                # 修正: onclickを削除し、data-hrefのみとする
+                yield f"""
                             <tr class="has-count ranking-row {row_rank_class}" data-href="#host/search.php?searchword={search_word}">
                                 <td align="center" style="font-weight:bold; font-size:1.1rem;">{rank_display}</td>
                                 <td>{item["anime"]} <span style="font-size:0.8em; color:#777;">({item["type"]})</span></td>
@@ -703,51 +538,58 @@ if cool_file and os.path.exists(cool_file):
                                 <td class="count-cell"><div class="count-wrapper"><span class="count-num">{item["count"]}</span>{bar_html}</div></td>
                             </tr>
                             """
-                            
-                    html_out += "</tbody></table></div></div>"
-                return html_out
 
-            # ★2種類のランキングを生成
-            ranking_count_html_content = generate_ranking_html("count")
-            ranking_user_html_content = generate_ranking_html("user")
-            
-            print("ランキング生成完了。")
+        yield "</tbody></table></div></div>"
 
-        else:
-            print("CSV読み込み失敗")
 
-    except Exception as e:
-        print(f"集計エラー: {e}")
-        import traceback
-        traceback.print_exc()
+# --- 段階9: セットリストのデータ出力 ---
+# 行データは index.html に埋め込まず、取得月ごとのJSONとして別ファイルに出力する
+# 戻り値: ページに埋め込む目次 (列名・シャードの一覧・版)
+def setlist_stage(final_df, output_file):
+    if not final_df.empty:
+        html_df = final_df.drop(columns=columns_to_hide + [HISTORY_DATE_COLUMN], errors='ignore')
+    else:
+        html_df = pd.DataFrame()
+    setlist_manifest = write_setlist_shards(html_df, setlist_output_dir(output_file))
+    setlist_manifest["dir"] = setlist_dir
+    return setlist_manifest
 
 
-# ==========================================
-# HTML生成 (HTML出力・印刷設定)
-# ==========================================
+def setlist_output_dir(output_file):
+    return os.path.join(os.path.dirname(output_file), setlist_dir)
+
 
-columns_to_hide = ['コメント'] 
-if not final_df.empty:
-    html_df = final_df.drop(columns=columns_to_hide, errors='ignore')
-else:
-    html_df = pd.DataFrame()
+# --- 関数: セットリストの出力ファイルの一覧 (シャードと検索索引) ---
+def setlist_output_files(setlist_manifest, output_file):
+    if not setlist_manifest["total"]:
+        return []
+    names = [shard["file"] for shard in setlist_manifest["shards"]] + [setlist_manifest["search"]]
+    return [os.path.join(setlist_output_dir(output_file), name) for name in names]
 
-setlist_rows = ""
-for _, row in html_df.iterrows():
-    setlist_rows += '<tr>'
-    for val in row:
-        setlist_rows += f'<td>{val}</td>'
-    setlist_rows += '</tr>'
 
-setlist_headers = ""
-for col in html_df.columns:
-    setlist_headers += f'<th onclick="sortTable({list(html_df.columns).index(col)})">{col} <i class="fas fa-sort"></i></th>'
+# --- 段階10: HTML生成 (HTML出力・印刷設定) ---
+# cool_tables / rankings が None の場合は集計データなしとして出力する
+# updated_at: ページの内容 (履歴・集計) が最後に変わった時刻 (見出しの「データ更新」)
+# 戻り値: 書き出したHTMLの文字数
+def render_stage(setlist_manifest, cool_tables, rankings, graph_series_data_count, graph_series_data_user, now, output_file,
+                 updated_at=None):
+    current_date_str = now.strftime("%Y/%m/%d")
+    current_datetime_str = (updated_at or now).strftime("%Y/%m/%d %H:%M")
 
-# グラフ用データをJSON形式に変換
-graph_json_count = json.dumps(graph_series_data_count, ensure_ascii=False)
-graph_json_user = json.dumps(graph_series_data_user, ensure_ascii=False)
+    cool_data_exists = cool_tables is not None
+    no_data_html = '<div style="padding:20px;text-align:center;color:#e74c3c;">{}</div>'
 
-html_content = f"""
+    setlist_manifest_json = json.dumps(setlist_manifest, ensure_ascii=False)
+    setlist_headers = render_setlist_headers(setlist_manifest["columns"])
+
+    # グラフ用データをJSON形式に変換
+    graph_json_count = json.dumps(graph_series_data_count, ensure_ascii=False)
+    graph_json_user = json.dumps(graph_series_data_user, ensure_ascii=False)
+
+    # ページは1つの文字列にまとめず、テンプレートの断片と表の行を順にファイルへ書き出す
+    # (集計表・ランキング (歌唱数用・歌唱人数用)・カテゴリごとのリストは断片を返すジェネレータ)
+    with HtmlWriter(output_file) as out:
+        out.write(f"""
 <!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -868,6 +710,22 @@ html_content = f"""
         tr:hover {{ background-color: #f1f8ff; }}
         tr.hidden {{ display: none !important; }}
 
+        /* セットリストは見えている行だけを描画するため、行の高さを1行分に揃える */
+        #setlistTable {{ table-layout: fixed; min-width: 860px; }}
+        #setlistTable th:nth-child(1) {{ width: 11%; }}
+        #setlistTable th:nth-child(2) {{ width: 6%; }}
+        #setlistTable th:nth-child(3) {{ width: 28%; }}
+        #setlistTable th:nth-child(4) {{ width: 20%; }}
+        #setlistTable th:nth-child(5) {{ width: 13%; }}
+        #setlistTable th:nth-child(6) {{ width: 12%; }}
+        #setlistTable th:nth-child(7) {{ width: 10%; }}
+        #setlistTable tbody tr {{ height: 28px; background-color: #fff; }}
+        #setlistTable tbody tr.alt {{ background-color: #fafafa; }}
+        #setlistTable tbody tr:hover {{ background-color: #f1f8ff; }}
+        #setlistTable tbody td {{ white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }}
+        #setlistTable tr.spacer, #setlistTable tr.spacer:hover {{ height: auto; background: transparent; }}
+        #setlistTable tr.spacer td {{ padding: 0; border: none; }}
+
         .category-header {{
             margin-top: 20px; padding: 10px 15px;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -985,7 +843,7 @@ html_content = f"""
     <div class="top-section">
         <div class="header-inner">
             <h1>Karaoke Dashboard</h1>
-            <div class="update-time">{current_datetime_str} 更新</div>
+            <div class="update-time">{current_datetime_str} データ更新</div>
         </div>
         <div class="tabs">
             <button class="tab-btn active" onclick="openTab('setlist')">セットリスト</button>
@@ -1023,29 +881,44 @@ html_content = f"""
         <div id="setlist" class="tab-content active">
             <table id="setlistTable">
                 <thead><tr>{setlist_headers}</tr></thead>
-                <tbody>{setlist_rows}</tbody>
+                <tbody id="setlistBody"></tbody>
             </table>
-            {"" if setlist_rows else '<div style="padding:20px;text-align:center">データがありません</div>'}
+            {"" if setlist_manifest["total"] else '<div style="padding:20px;text-align:center">データがありません</div>'}
         </div>
 
         <div id="analysis" class="tab-content">
             <div style="margin-top:15px; font-size:0.9rem; color:#7f8c8d; text-align:right;">集計対象: 2026/01/01 - 2026/03/31</div>
             <div id="print-target">
-                {analysis_html_content if cool_data_exists else '<div style="padding:20px;text-align:center;color:#e74c3c;">集計データがありません</div>'}
+                """)
+        if cool_data_exists:
+            out.write_all(iter_analysis_html(cool_tables))
+        else:
+            out.write(no_data_html.format("集計データがありません"))
+        out.write("""
             </div>
         </div>
 
         <div id="ranking_count" class="tab-content">
             <div style="margin-top:15px; font-size:0.9rem; color:#7f8c8d; text-align:right;">集計対象: 2026/01/01 - 2026/03/31</div>
             <div id="ranking-count-print-target">
-                {ranking_count_html_content if ranking_count_html_content else '<div style="padding:20px;text-align:center;color:#e74c3c;">ランキング対象データがありません</div>'}
+                """)
+        if rankings is not None and rankings["count"]:
+            out.write_all(iter_ranking_html(rankings, "count"))
+        else:
+            out.write(no_data_html.format("ランキング対象データがありません"))
+        out.write("""
             </div>
         </div>
         
         <div id="ranking_user" class="tab-content">
             <div style="margin-top:15px; font-size:0.9rem; color:#7f8c8d; text-align:right;">集計対象: 2026/01/01 - 2026/03/31</div>
             <div id="ranking-user-print-target">
-                {ranking_user_html_content if ranking_user_html_content else '<div style="padding:20px;text-align:center;color:#e74c3c;">ランキング対象データがありません</div>'}
+                """)
+        if rankings is not None and rankings["user"]:
+            out.write_all(iter_ranking_html(rankings, "user"))
+        else:
+            out.write(no_data_html.format("ランキング対象データがありません"))
+        out.write("""
             </div>
         </div>
 
@@ -1065,8 +938,16 @@ html_content = f"""
         </div>
     </div>
 
-    <div id="list-created-content" style="display:none;">{created_lists_html}</div>
-    <div id="list-uncreated-content" style="display:none;">{uncreated_lists_html}</div>
+    <div id="list-created-content" style="display:none;">""")
+        if cool_data_exists:
+            for category, entries in cool_tables.items():
+                out.write_all(generate_category_html_block(category, [d for d in entries if d["creation_count"] >= 1]))
+        out.write("""</div>
+    <div id="list-uncreated-content" style="display:none;">""")
+        if cool_data_exists:
+            for category, entries in cool_tables.items():
+                out.write_all(generate_category_html_block(category, [d for d in entries if d["creation_count"] < 1]))
+        out.write(f"""</div>
 
 <script>
     const host = 'http://ykr.moe:11059';
@@ -1251,7 +1132,10 @@ html_content = f"""
         document.getElementById('ctrl-ranking-user').style.display = 'none';
         document.querySelector('.ctrl-graph').style.display = 'none';
 
-        if(tabName === 'setlist') document.getElementById('ctrl-setlist').style.display = 'flex';
+        if(tabName === 'setlist') {{
+            document.getElementById('ctrl-setlist').style.display = 'flex';
+            renderRows(true);
+        }}
         else if(tabName === 'analysis') document.getElementById('ctrl-analysis').style.display = 'flex';
         else if(tabName === 'ranking_count') document.getElementById('ctrl-ranking-count').style.display = 'flex';
         else if(tabName === 'ranking_user') document.getElementById('ctrl-ranking-user').style.display = 'flex';
@@ -1434,46 +1318,286 @@ html_content = f"""
 
     const searchInput = document.getElementById("searchInput");
     const table = document.getElementById("setlistTable");
+    const setlistBody = document.getElementById("setlistBody");
+    const setlistScroll = document.getElementById("setlist");
     const countDisplay = document.getElementById('countDisplay');
-    let tableData = [];
-    let tbodyRows = [];
-
-    window.addEventListener('DOMContentLoaded', () => {{
-        const tbody = table.tBodies[0];
-        if (tbody) {{
-            tbodyRows = Array.from(tbody.rows);
-            tableData = tbodyRows.map(row => row.innerText.toUpperCase());
-            countDisplay.innerText = '全 ' + tbodyRows.length + ' 件';
-        }}
-    }});
+
+    // ★セットリストは取得月ごとのJSONを読み込み、画面に見えている範囲の行だけDOMを作る
+    const setlistManifest = {setlist_manifest_json};
+    const OVERSCAN_ROWS = 30;
+    const columnValues = setlistManifest.columns.map(() => []);  // 列ごとの表示文字列
+    const sortKeys = setlistManifest.columns.map(() => []);      // 列ごとの並べ替えキー (整数、文字列の列は値の番号)
+    // 文字列の列 (生成時の順位なし) は重複しない値に番号を振り、並べ替えるときに値の順位を Intl.Collator('ja') で決める
+    const distinctValues = setlistManifest.columns.map(() => null);  // 列ごとの値の一覧 (番号順)
+    const valueIds = setlistManifest.columns.map(() => null);        // 列ごとの 値 → 番号
+    const valueRanks = setlistManifest.columns.map(() => null);      // 列ごとの 番号 → 順位 (値が増えたら作り直す)
+    const collator = new Intl.Collator('ja');
+    const foldedTexts = [];  // 検索用 (行の全列を NFKC・大文字に畳み込んで連結、必要になった行だけ作る)
+    let loadedRows = 0;
+    let rowOrder = [];       // 並べ替え後の行番号
+    let visibleRows = [];    // 検索で残った行番号 (rowOrder の順)
+    let searchKeywords = [];
+    let searchMatches = null;  // 検索に一致した行の印 (null は絞り込みなし)
+    let searchIndex = null;    // 生成時に作った n-gram 転置索引
+    let searchIndexRequest = null;
+    let searchApplied = false;
+    let sortState = null;
+    let rowHeight = 28;
+    let renderedRange = '';
+    let renderQueued = false;
+
+    window.addEventListener('DOMContentLoaded', loadSetlist);
 
     searchInput.addEventListener("keyup", function(event) {{
         if (event.key === "Enter") performSearch();
     }});
 
-    function performSearch() {{
-        const filter = searchInput.value.toUpperCase();
-        const keywords = filter.replace(/　/g, " ").split(" ").filter(k => k.length > 0);
-        let visibleCount = 0;
-        const total = tableData.length;
-        
-        for (let i = 0; i < total; i++) {{
-            let isMatch = true;
-            const rowText = tableData[i];
-            for (let k = 0; k < keywords.length; k++) {{
-                if (rowText.indexOf(keywords[k]) === -1) {{
-                    isMatch = false; break;
+    setlistScroll.addEventListener('scroll', () => {{
+        if (renderQueued) return;
+        renderQueued = true;
+        requestAnimationFrame(() => {{
+            renderQueued = false;
+            renderRows(false);
+        }});
+    }});
+    window.addEventListener('resize', () => renderRows(true));
+
+    function loadSetlist() {{
+        if (!setlistManifest.total) {{
+            countDisplay.innerText = '全 0 件';
+            return;
+        }}
+        const query = '?v=' + setlistManifest.version;
+        // 取得は並行、追加は新しい月から順に
+        const requests = setlistManifest.shards.map(s => fetch(setlistManifest.dir + '/' + s.file + query).then(res => {{
+            if (!res.ok) throw new Error(s.file + ': ' + res.status);
+            return res.json();
+        }}));
+        requests.forEach(req => req.catch(() => {{}}));
+        requests.reduce((prev, req) => prev.then(() => req).then(appendShard), Promise.resolve())
+            .catch(err => {{
+                console.error(err);
+                countDisplay.innerText = 'データの読み込みに失敗しました';
+            }});
+    }}
+
+    function appendShard(shard) {{
+        const start = loadedRows;
+        const end = start + shard.rows;
+        shard.columns.forEach((col, c) => {{
+            const target = columnValues[c];
+            const keys = sortKeys[c];
+            const codeKeys = col.dict && (col.keys || col.dict.map(value => valueId(c, value)));
+            for (let i = 0; i < shard.rows; i++) {{
+                if (col.dict) {{
+                    target.push(col.dict[col.codes[i]]);
+                    keys.push(codeKeys[col.codes[i]]);
+                }} else {{
+                    target.push(String(col.values[i]));
+                    keys.push(col.values[i]);
                 }}
             }}
-            
-            if (isMatch || keywords.length === 0) {{
-                tbodyRows[i].classList.remove('hidden');
-                visibleCount++;
+        }});
+        for (let i = start; i < end; i++) rowOrder.push(i);
+        loadedRows = end;
+        if (sortState) sortRows();
+        updateMatches();
+        applyFilter();
+    }}
+
+    // 検索索引は表の表示には不要なので、最初に検索したときに読み込む
+    // (届くまでと読めなかった場合は全行を調べて検索する。どちらでも結果は同じ)
+    function loadSearchIndex() {{
+        if (!searchIndexRequest) {{
+            searchIndexRequest = fetch(setlistManifest.dir + '/' + setlistManifest.search + '?v=' + setlistManifest.version)
+                .then(res => {{
+                    if (!res.ok) throw new Error(setlistManifest.search + ': ' + res.status);
+                    return res.json();
+                }})
+                .then(data => {{ searchIndex = decodeSearchIndex(data); }})
+                .catch(err => console.error(err));
+        }}
+        return searchIndexRequest;
+    }}
+
+    // 可変長整数 (7bitずつ) の base64 を [件数, 先頭, 差分...] ごとの番号の一覧に戻す
+    function unpackIdLists(packed) {{
+        const bin = atob(packed);
+        const lists = [];
+        let list = null, remaining = 0, prev = 0, value = 0, shift = 0;
+        for (let p = 0; p < bin.length; p++) {{
+            const b = bin.charCodeAt(p);
+            value |= (b & 0x7f) << shift;
+            if (b & 0x80) {{
+                shift += 7;
+                continue;
+            }}
+            if (list === null) {{
+                list = [];
+                remaining = value;
+                prev = 0;
             }} else {{
-                tbodyRows[i].classList.add('hidden');
+                prev += value;
+                list.push(prev);
+                remaining--;
             }}
+            if (remaining === 0) {{
+                lists.push(list);
+                list = null;
+            }}
+            value = 0;
+            shift = 0;
+        }}
+        return lists;
+    }}
+
+    function decodeSearchIndex(data) {{
+        const chars = Array.from(data.grams);
+        const postings = unpackIdLists(data.postings);
+        const grams = new Map();
+        for (let g = 0; g < postings.length; g++) {{
+            grams.set(chars.slice(g * data.n, (g + 1) * data.n).join(''), postings[g]);
         }}
-        countDisplay.innerText = '表示: ' + visibleCount + ' / ' + total;
+        return {{ n: data.n, grams: grams, common: new Set(data.common), valueRows: unpackIdLists(data.rows) }};
+    }}
+
+    function foldedText(i) {{
+        let text = foldedTexts[i];
+        if (text === undefined) {{
+            text = foldedTexts[i] = columnValues.map(values => values[i]).join('\\t').normalize('NFKC').toUpperCase();
+        }}
+        return text;
+    }}
+
+    function intersectSorted(a, b) {{
+        const out = [];
+        let i = 0, j = 0;
+        while (i < a.length && j < b.length) {{
+            if (a[i] < b[j]) i++;
+            else if (a[i] > b[j]) j++;
+            else {{
+                out.push(a[i]);
+                i++;
+                j++;
+            }}
+        }}
+        return out;
+    }}
+
+    // 検索語の n-gram の一覧の共通部分から候補のセル値を求め、その値を含む行 (昇順) を返す
+    // 索引で絞り込めない検索語 (n 文字未満・よくある n-gram だけ) は null
+    function keywordCandidates(keyword) {{
+        if (!searchIndex) return null;
+        const chars = Array.from(keyword);
+        const n = searchIndex.n;
+        let values = null;
+        for (let p = 0; p + n <= chars.length; p++) {{
+            const gram = chars.slice(p, p + n).join('');
+            if (searchIndex.common.has(gram)) continue;
+            const posting = searchIndex.grams.get(gram) || [];
+            values = values === null ? posting : intersectSorted(values, posting);
+            if (values.length === 0) return [];
+        }}
+        if (values === null) return null;
+        const rows = [];
+        values.forEach(v => searchIndex.valueRows[v].forEach(r => rows.push(r)));
+        rows.sort((a, b) => a - b);
+        return rows.filter((r, k) => k === 0 || r !== rows[k - 1]);
+    }}
+
+    // 全検索語の候補の共通部分だけを行テキストで確かめる (AND 検索)
+    function updateMatches() {{
+        if (searchKeywords.length === 0) {{
+            searchMatches = null;
+            return;
+        }}
+        let candidates = null;
+        for (let k = 0; k < searchKeywords.length; k++) {{
+            const rows = keywordCandidates(searchKeywords[k]);
+            if (rows === null) continue;
+            candidates = candidates === null ? rows : intersectSorted(candidates, rows);
+            if (candidates.length === 0) break;
+        }}
+        const matched = new Uint8Array(loadedRows);
+        const test = i => searchKeywords.every(keyword => foldedText(i).indexOf(keyword) !== -1);
+        if (candidates === null) {{
+            for (let i = 0; i < loadedRows; i++) {{
+                if (test(i)) matched[i] = 1;
+            }}
+        }} else {{
+            candidates.forEach(i => {{
+                if (i < loadedRows && test(i)) matched[i] = 1;
+            }});
+        }}
+        searchMatches = matched;
+    }}
+
+    function applyFilter() {{
+        visibleRows = searchMatches ? rowOrder.filter(i => searchMatches[i]) : rowOrder;
+        const loaded = loadedRows;
+        let text = searchApplied ? '表示: ' + visibleRows.length + ' / ' + loaded : '全 ' + loaded + ' 件';
+        if (loaded < setlistManifest.total) text += ' (読み込み中...)';
+        countDisplay.innerText = text;
+        renderRows(true);
+    }}
+
+    function makeSpacer(height) {{
+        const tr = document.createElement('tr');
+        tr.className = 'spacer';
+        const td = document.createElement('td');
+        td.colSpan = columnValues.length;
+        td.style.height = height + 'px';
+        tr.appendChild(td);
+        return tr;
+    }}
+
+    // 表示範囲 (前後に余裕を持たせる) の行だけを作り、上下は空行で高さを合わせる
+    function renderRows(force) {{
+        const total = visibleRows.length;
+        const offset = table.offsetTop + table.tHead.offsetHeight;
+        const top = Math.max(0, setlistScroll.scrollTop - offset);
+        const first = Math.max(0, Math.floor(top / rowHeight) - OVERSCAN_ROWS);
+        const last = Math.min(total, first + Math.ceil(setlistScroll.clientHeight / rowHeight) + OVERSCAN_ROWS * 2);
+        const range = first + ':' + last;
+        if (!force && range === renderedRange) return;
+        renderedRange = range;
+
+        const frag = document.createDocumentFragment();
+        frag.appendChild(makeSpacer(first * rowHeight));
+        for (let v = first; v < last; v++) {{
+            const i = visibleRows[v];
+            const tr = document.createElement('tr');
+            if (v % 2 === 1) tr.className = 'alt';
+            for (let c = 0; c < columnValues.length; c++) {{
+                const td = document.createElement('td');
+                td.textContent = columnValues[c][i];
+                td.title = columnValues[c][i];
+                tr.appendChild(td);
+            }}
+            frag.appendChild(tr);
+        }}
+        frag.appendChild(makeSpacer((total - last) * rowHeight));
+        setlistBody.textContent = '';
+        setlistBody.appendChild(frag);
+
+        // 実際の行の高さで計算し直す (非表示のタブでは測れないので見送る)
+        if (last > first) {{
+            const measured = setlistBody.rows[1].getBoundingClientRect().height;
+            if (measured > 0 && Math.abs(measured - rowHeight) > 0.01) {{
+                rowHeight = measured;
+                renderRows(true);
+            }}
+        }}
+    }}
+
+    function performSearch() {{
+        // 索引と同じ畳み込み (NFKC・大文字) をしてから空白で区切る (全角空白は NFKC で半角になる)
+        const filter = searchInput.value.normalize('NFKC').toUpperCase();
+        searchKeywords = filter.split(" ").filter(k => k.length > 0);
+        searchApplied = true;
+        if (setlistManifest.total && searchKeywords.length) loadSearchIndex();
+        updateMatches();
+        applyFilter();
     }}
 
     function resetFilter() {{
@@ -1481,34 +1605,308 @@ html_content = f"""
         performSearch();
     }}
 
+    function valueId(c, value) {{
+        if (!valueIds[c]) {{
+            valueIds[c] = new Map();
+            distinctValues[c] = [];
+        }}
+        let id = valueIds[c].get(value);
+        if (id === undefined) {{
+            id = distinctValues[c].length;
+            valueIds[c].set(value, id);
+            distinctValues[c].push(value);
+        }}
+        return id;
+    }}
+
+    // 値の比較 (旧 sortTable と同じく、両方数値なら大小、それ以外は localeCompare('ja') と同じ順)
+    function compareValues(a, b) {{
+        if (!isNaN(a) && !isNaN(b) && a !== '' && b !== '') return a - b;
+        return collator.compare(a, b);
+    }}
+
+    // 文字列の列の 値の番号 → 順位 (比較して同じ値は同じ順位)
+    function columnRanks(c) {{
+        const values = distinctValues[c];
+        if (valueRanks[c] && valueRanks[c].length === values.length) return valueRanks[c];
+        const trimmed = values.map(v => v.trim());
+        const order = values.map((v, id) => id).sort((a, b) => compareValues(trimmed[a], trimmed[b]));
+        const ranks = new Int32Array(values.length);
+        for (let k = 1; k < order.length; k++) {{
+            ranks[order[k]] = compareValues(trimmed[order[k - 1]], trimmed[order[k]]) === 0 ? ranks[order[k - 1]] : k;
+        }}
+        return valueRanks[c] = ranks;
+    }}
+
+    // 整数の並べ替えキーで行番号を並べ替える (文字列の列は値ごとの順位を使い、行ごとの文字列の比較はしない)
+    // 同じキーの行は元の並び (取得日の新しい順) を保つ
+    function sortRows() {{
+        const c = sortState.col;
+        const ids = sortKeys[c];
+        const ranks = distinctValues[c] ? columnRanks(c) : null;
+        const keys = ranks ? Int32Array.from(ids, id => ranks[id]) : ids;
+        const asc = sortState.dir === 'asc';
+        const n = loadedRows;
+        let min = Infinity, max = -Infinity;
+        for (let i = 0; i < n; i++) {{
+            if (keys[i] < min) min = keys[i];
+            if (keys[i] > max) max = keys[i];
+        }}
+        const rank = i => asc ? keys[i] - min : max - keys[i];
+        const range = n ? max - min + 1 : 0;
+        if (range <= n * 4 + 1024) {{
+            // キーの幅が狭い (文字列列の順位・順番) ときは数え上げソート
+            const starts = new Int32Array(range + 1);
+            for (let i = 0; i < n; i++) starts[rank(i) + 1]++;
+            for (let k = 1; k <= range; k++) starts[k] += starts[k - 1];
+            const order = new Array(n);
+            for (let i = 0; i < n; i++) order[starts[rank(i)]++] = i;
+            rowOrder = order;
+        }} else {{
+            // キーと行番号を1つの数値にまとめ、比較関数なしで数値配列として並べ替える
+            const packed = new Float64Array(n);
+            for (let i = 0; i < n; i++) packed[i] = rank(i) * n + i;
+            packed.sort();
+            rowOrder = Array.from(packed, v => v % n);
+        }}
+    }}
+
     function sortTable(n) {{
-        const tbody = table.tBodies[0];
-        const rows = Array.from(tbody.rows);
         const th = table.querySelectorAll('th')[n];
         let dir = th.getAttribute('data-dir') === 'asc' ? 'desc' : 'asc';
         
         table.querySelectorAll('th').forEach(h => h.setAttribute('data-dir', ''));
         th.setAttribute('data-dir', dir);
 
-        rows.sort((a, b) => {{
-            const valA = a.cells[n].innerText.trim();
-            const valB = b.cells[n].innerText.trim();
-            if (!isNaN(valA) && !isNaN(valB) && valA!=='' && valB!=='') {{
-                return dir === 'asc' ? valA - valB : valB - valA;
-            }}
-            return dir === 'asc' ? valA.localeCompare(valB,'ja') : valB.localeCompare(valA,'ja');
-        }});
-        rows.forEach(row => tbody.appendChild(row));
-        tbodyRows = rows;
-        tableData = tbodyRows.map(row => row.innerText.toUpperCase());
+        sortState = {{col: n, dir: dir}};
+        sortRows();
+        applyFilter();
     }}
 </script>
 </body>
 </html>
-"""
+""")
+    print(f"HTML生成完了: {output_file}")
+    return out.length
 
-with open("index.html", "w", encoding="utf-8") as f:
-    f.write(html_content)
-    print("HTML生成完了: index.html")
 
+# ==========================================
+# ★実行 (各段階の所要時間・入出力件数・キャッシュ利用を記録)
+# 入力 (履歴・クール集計表・オフラインリスト・生成処理のソース・日付) の内容が
+# 前回と同じ部分は作り直さない (force=True なら全て作り直す)
+# inputs (LoadedInputs) を渡すと、読み込んだ履歴・オフラインリスト・集計表を次の実行でも使い回す (常駐モード)
+# ==========================================
+def run_pipeline(now=None, force=False, inputs=None, run_interval=RUN_INTERVAL):
+    if inputs is not None:
+        return run_update(now, force, inputs, run_interval)
+    inputs = LoadedInputs()
+    try:
+        return run_update(now, force, inputs, run_interval)
+    finally:
+        inputs.close()
+
+
+def run_update(now, force, inputs, run_interval):
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
+    recorder = StageRecorder()
+
+    with recorder.stage("load_history") as st:
+        history_db, _ = inputs.get("history_db", HISTORY_DB_FILE, open_history_db)
+        history_db, rebuilt = load_history_stage(history_file, history_db)
+        st["rows_out"] = history_db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        st["cache_hits"] = 0 if rebuilt else 1
+
+    rooms, _ = inputs.get("rooms", file_digest(room_registry_file), lambda: load_room_registry(room_registry_file))
+    with recorder.stage("fetch", rows_in=len(rooms)) as st:
+        new_data_frames, fetch_cache, fetch_stats = fetch_stage(rooms, now, history_db, history_file, force=force,
+                                                                run_interval=run_interval)
+        st["rows_out"] = sum(len(df) for df in new_data_frames)
+        st["cache_hits"] = fetch_stats.get("unchanged", 0) + fetch_stats["skipped"]
+
+    with recorder.stage("merge", rows_in=sum(len(df) for df in new_data_frames)) as st:
+        added_count = merge_stage(history_db, new_data_frames, history_file, fetch_cache)
+        st["rows_out"] = added_count
+
+    # --- 入力の指紋: 各部分のキーは、その部分が使う入力のハッシュ値から作る ---
+    build_manifest = {} if force else load_build_manifest()
+    generator_digest = source_digest(GENERATOR_SOURCES)
+    history_digest = file_digest(history_file)
+    setlist_key = fingerprint("setlist", generator_digest, history_digest)
+    offline_files = discover_offline_files(offline_file_pattern)
+    offline_cache = load_offline_cache()
+    offline_key = offline_digests(offline_files, offline_cache)
+    analysis_key = fingerprint("analysis", generator_digest, history_digest, file_digest(cool_file), offline_key)
+    # ページには出力日 (保存用リストの日付) も入るので、日付が変わったら作り直す
+    page_key = fingerprint("page", setlist_key, analysis_key, now.strftime("%Y/%m/%d"))
+    if is_fresh(build_manifest, "page", page_key) and is_fresh(build_manifest, "setlist", setlist_key):
+        print("入力に変更がないため、集計とページ生成を省略します。")
+        return recorder
+    # 見出しの更新時刻は内容が変わったときの時刻 (日付が変わっただけの作り直しでは前回のまま)
+    data_key = fingerprint("data", setlist_key, analysis_key)
+    previous_page = build_manifest.get("page", {})
+    if previous_page.get("data_key") == data_key and previous_page.get("updated_at"):
+        updated_at = datetime.datetime.fromisoformat(previous_page["updated_at"])
+    else:
+        updated_at = now
+
+    # 全履歴はセットリストを作り直すときだけ読み込む (列ごとの保存ファイルがあればそこから)
+    # 履歴が変わるとセットリスト (全シャード・検索索引) は全行から作り直す
+    with recorder.stage("setlist") as st:
+        if is_fresh(build_manifest, "setlist", setlist_key):
+            setlist_manifest = build_manifest["setlist"]["manifest"]
+            st["rows_in"] = setlist_manifest["total"]
+            st["cache_hits"] = 1
+        else:
+            final_df, _ = inputs.get("final_df", history_digest,
+                                     lambda: load_history_frame(history_db, history_digest)[0])
+            st["rows_in"] = len(final_df)
+            setlist_manifest = setlist_stage(final_df, output_file)
+        st["rows_out"] = setlist_manifest["total"]
+    build_manifest["setlist"] = {
+        "key": setlist_key,
+        "manifest": setlist_manifest,
+        "outputs": output_digests(setlist_output_files(setlist_manifest, output_file)),
+    }
+
+    cool_tables = None
+    rankings = None
+    graph_series_data_count = {}
+    graph_series_data_user = {}
+    analysis_ok = True
+    analysis_cache = None if force else load_analysis_cache(analysis_key)
+    if analysis_cache is not None:
+        with recorder.stage("load_analysis") as st:
+            cool_tables = analysis_cache["cool_tables"]
+            rankings = analysis_cache["rankings"]
+            graph_series_data_count = analysis_cache["graph_count"]
+            graph_series_data_user = analysis_cache["graph_user"]
+            st["cache_hits"] = 1
+        print("集計の入力に変更がないため、前回の集計結果を使用します。")
+    else:
+        try:
+            with recorder.stage("load_offline") as st:
+                (offline_targets, offline_index), reused = inputs.get(
+                    "offline", offline_key, lambda: load_offline_stage(offline_files, offline_cache))
+                st["rows_out"] = len(offline_targets)
+                st["cache_hits"] = int(reused)
+
+            with recorder.stage("parse_cool") as st:
+                categorized_data, reused = inputs.get("cool", file_digest(cool_file), lambda: parse_cool_stage(cool_file))
+                st["rows_out"] = sum(len(items) for items in categorized_data.values()) if categorized_data else 0
+                st["cache_hits"] = int(reused)
+
+            if categorized_data is not None:
+                # 前回から取り込まれた行だけを日ごとの集計に足し込む
+                with recorder.stage("rollup") as st:
+                    rollup_stats = rollup_stage(history_db, now, cool_item_keys(categorized_data), generator_digest,
+                                                force=force)
+                    st["rows_in"] = rollup_stats["rows"]
+                    st["rows_out"] = rollup_stats["added"]
+                    st["cache_hits"] = 0 if rollup_stats["rebuilt"] else 1
+
+                rollup = load_rollup(history_db)
+                with recorder.stage("match", rows_in=len(rollup)) as st:
+                    cool_tables_matched = match_stage(rollup, categorized_data, offline_index)
+                    matched_total = sum(d["count"] for entries in cool_tables_matched.values() for d in entries)
+                    st["rows_out"] = matched_total
+                    st["cache_hits"] = offline_index.cache_hits
+                print("クール集計処理完了。")
+
+                print("ランキング生成処理開始...")
+                with recorder.stage("rank", rows_in=len(rollup)) as st:
+                    graph_series_data_count, graph_series_data_user, rankings = rank_stage(
+                        rollup, categorized_data, cool_tables_matched)
+                    st["rows_out"] = sum(len(points) for points in graph_series_data_count.values())
+                cool_tables = cool_tables_matched
+                print("ランキング生成完了。")
+
+            save_analysis_cache(analysis_key, cool_tables=cool_tables, rankings=rankings,
+                                graph_count=graph_series_data_count, graph_user=graph_series_data_user)
 
+        except Exception as e:
+            print(f"集計エラー: {e}")
+            traceback.print_exc()
+            rankings = None
+            # 集計できなかったページは記録せず、次回作り直す
+            analysis_ok = False
+
+    with recorder.stage("render", rows_in=setlist_manifest["total"]) as st:
+        st["rows_out"] = render_stage(setlist_manifest, cool_tables, rankings,
+                                      graph_series_data_count, graph_series_data_user, now, output_file,
+                                      updated_at=updated_at)
+
+    if analysis_ok:
+        build_manifest["page"] = {"key": page_key, "data_key": data_key, "updated_at": updated_at.isoformat(),
+                                  "outputs": output_digests([output_file])}
+    else:
+        build_manifest.pop("page", None)
+    save_build_manifest(build_manifest)
+    return recorder
+
+
+# --- 常駐モード: 読み込んだ入力を保持したまま、一定の周期で取得・更新を繰り返す ---
+# 部屋ごとの取得間隔は周期を単位に調整し、入力が変わったときだけ集計・ページ生成を行う
+def run_daemon(interval=DAEMON_INTERVAL, force=False):
+    print(f"常駐モードで開始します (周期 {interval} 秒、Ctrl+C で終了)")
+    inputs = LoadedInputs()
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                recorder = run_pipeline(force=force, inputs=inputs, run_interval=interval)
+                if any(record["stage"] == "render" for record in recorder.stages):
+                    recorder.print_summary()
+            except Exception as e:
+                print(f"更新エラー: {e}")
+                traceback.print_exc()
+                # 読み込み結果が壊れている可能性があるので、次の周期は読み込み直す
+                inputs.close()
+            force = False
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print("常駐モードを終了します。")
+    finally:
+        inputs.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="カラオケ履歴の取得と index.html の生成")
+    parser.add_argument("--force", action="store_true",
+                        help="全部屋を取得し、入力が前回と同じでも集計とページ生成をやり直す")
+    parser.add_argument("--daemon", action="store_true",
+                        help="終了せずに取得・更新を繰り返す (周期は --interval 秒)")
+    parser.add_argument("--interval", type=int, default=DAEMON_INTERVAL,
+                        help="--daemon の取得の周期 (秒)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"cProfile の統計と段階ごとの所要時間 (JSON) を {PROFILE_DIR} に保存する")
+    args = parser.parse_args(argv)
+
+    if args.daemon:
+        run_daemon(args.interval, force=args.force)
+        return
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        recorder = run_pipeline(force=args.force)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    recorder.print_summary()
+
+    if profiler is not None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prof_file = os.path.join(PROFILE_DIR, f"update_list_{stamp}.prof")
+        report_file = os.path.join(PROFILE_DIR, f"update_list_{stamp}.json")
+        profiler.dump_stats(prof_file)
+        recorder.write_json(report_file, created=stamp, profile=prof_file)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        print(f"プロファイルを保存しました: {prof_file} / {report_file}")
+
+
+if __name__ == "__main__":
+    main()